@@ -0,0 +1,243 @@
+# -----------------------------------------------------------
+# backtests allocation rules on a price panel and sweeps their parameters
+#
+# Stevens Institute of Technology, Hoboken, New Jersey
+# Stevens Student Managed Investment Fund
+# -----------------------------------------------------------
+
+import os
+import itertools
+import warnings
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from src.asset_allocation import optimizer
+from src.metrics import risk_metrics
+from src.metrics.panel_metrics import risk_panel
+
+
+# rules take the price history up to and including the rebalance day (rows are days, columns are stocks, NaN before
+# a stock listed) plus their parameters, and return the target weights. Weights that add up to less than 1 leave the
+# rest in cash.
+
+def _listed(prices: np.ndarray) -> np.ndarray:
+    return ~np.isnan(prices[-1])
+
+
+def _returns(prices: np.ndarray, lookback) -> np.ndarray:
+    window = prices[-(lookback + 1):]
+    return window[1:] / window[:-1] - 1
+
+
+def equal_weight(prices: np.ndarray) -> np.ndarray:
+    listed = _listed(prices)
+    return listed / max(listed.sum(), 1)
+
+
+def inverse_volatility(prices: np.ndarray, lookback=63) -> np.ndarray:
+    """Weights proportional to 1 / the volatility of the last lookback days of returns"""
+    vol = np.full(prices.shape[1], np.nan)
+    if len(prices) > 2:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # stocks without enough prices get a NaN volatility
+            vol = np.nanstd(_returns(prices, lookback), axis=0, ddof=1)
+    inverse = np.where(_listed(prices) & (vol > 0), 1 / np.where(vol > 0, vol, 1.0), 0.0)
+    return inverse / inverse.sum() if inverse.sum() > 0 else equal_weight(prices)
+
+
+def momentum(prices: np.ndarray, lookback=252, skip=21, top=10) -> np.ndarray:
+    """Equal weights in the top stocks by return over lookback days, leaving out the most recent skip days"""
+    if len(prices) <= skip + 1:
+        return equal_weight(prices)
+    past = prices[-(lookback + 1)] if len(prices) > lookback else prices[0]
+    score = prices[-(skip + 1)] / past - 1
+    score = np.where(np.isnan(score) | ~_listed(prices), -np.inf, score)
+    chosen = np.argsort(-score, kind='stable')[:min(top, int(np.isfinite(score).sum()))]
+    weights = np.zeros(prices.shape[1])
+    weights[chosen] = 1 / max(len(chosen), 1)
+    return weights
+
+
+def _cov_rule(prices, lookback, solve):
+    listed = _listed(prices)
+    if listed.sum() <= 1:
+        return equal_weight(prices)  # nothing to diversify, all in the one stock listed so far (or nothing)
+    returns = _returns(prices, lookback)[:, listed]
+    returns = returns[~np.isnan(returns).any(axis=1)]
+    if len(returns) <= listed.sum():
+        return inverse_volatility(prices, lookback)
+    cov = pd.DataFrame(np.cov(returns.T))
+    weights = np.zeros(prices.shape[1])
+    weights[listed] = solve(cov).to_numpy()
+    return weights
+
+
+def minimum_variance(prices: np.ndarray, lookback=252, upper=1.0) -> np.ndarray:
+    """Long-only minimum variance weights from the sample covariance of the last lookback days"""
+    return _cov_rule(prices, lookback, lambda cov: optimizer.min_variance(cov, upper=upper))
+
+
+def risk_parity(prices: np.ndarray, lookback=252) -> np.ndarray:
+    """Equal risk contribution weights from the sample covariance of the last lookback days"""
+    return _cov_rule(prices, lookback, optimizer.risk_parity)
+
+
+RULES = {
+    'equal_weight': equal_weight,
+    'inverse_volatility': inverse_volatility,
+    'momentum': momentum,
+    'minimum_variance': minimum_variance,
+    'risk_parity': risk_parity,
+}
+
+
+def simulate(prices: np.ndarray, rule, params=None, rebalance=21, cost_bps=10.0, warmup=0, initial=1.0,
+             keep_weights=False) -> dict:
+    """Runs a rule over a (days x stocks) array of prices. The book is rebalanced to the rule's weights every
+    rebalance days starting at day warmup, paying cost_bps basis points on the value traded, and holds its shares
+    (drifting with prices) in between. Only the rule is called per rebalance: the value of the book over each holding
+    period is one product of that slice of the price array with the share counts.
+
+    Returns arrays: nav (NaN before warmup), the rebalance days, the turnover and costs of each rebalance and, with
+    keep_weights, the daily drifted weights."""
+    return _simulate(prices, *_fill(prices), rule, params or {}, rebalance, cost_bps, warmup, initial, keep_weights)
+
+
+def _fill(prices: np.ndarray) -> tuple:
+    """A stock that stopped trading keeps its last price, one that hasn't listed yet is valued at 0 and never bought"""
+    filled = pd.DataFrame(prices).ffill().to_numpy()
+    return filled, np.where(np.isnan(filled), 0.0, filled)
+
+
+def _simulate(prices, filled, valued, rule, params, rebalance, cost_bps, warmup, initial, keep_weights) -> dict:
+    days = np.arange(warmup, len(prices), rebalance)
+    nav = np.full(len(prices), np.nan)
+    weights = np.zeros(prices.shape) if keep_weights else None
+    turnover, costs = np.zeros(len(days)), np.zeros(len(days))
+
+    shares, cash, value = np.zeros(prices.shape[1]), initial, initial
+    for k, (start, end) in enumerate(zip(days, np.append(days[1:], len(prices)))):
+        value = valued[start] @ shares + cash
+        held = valued[start] * shares / value
+        target = np.asarray(rule(prices[:start + 1], **params), dtype=float)
+        target = np.where(np.isnan(filled[start]) | np.isnan(target), 0.0, target)
+        turnover[k] = np.abs(target - held).sum()
+        costs[k] = cost_bps / 1e4 * turnover[k] * value
+        value -= costs[k]
+        shares = np.divide(target * value, valued[start], out=np.zeros_like(target), where=valued[start] > 0)
+        cash = value - valued[start] @ shares
+        nav[start:end] = valued[start:end] @ shares + cash
+        if keep_weights:
+            weights[start:end] = valued[start:end] * shares / nav[start:end, None]
+    return {'nav': nav, 'days': days, 'turnover': turnover, 'costs': costs, 'weights': weights}
+
+
+class BacktestResult:
+    """The NAV, trading and (optionally) daily weights of a backtest, indexed by the price panel's dates"""
+
+    def __init__(self, price_data: pd.DataFrame, simulation: dict):
+        self.nav = pd.Series(simulation['nav'], index=price_data.index, name='NAV').dropna()
+        rebalances = price_data.index[simulation['days']]
+        self.turnover = pd.Series(simulation['turnover'], index=rebalances, name='Turnover')
+        self.costs = pd.Series(simulation['costs'], index=rebalances, name='Costs')
+        self.weights = None
+        if simulation['weights'] is not None:
+            self.weights = pd.DataFrame(simulation['weights'], index=price_data.index,
+                                        columns=price_data.columns).loc[self.nav.index]
+
+    def summary(self) -> pd.Series:
+        years = len(self.nav) / 252
+        returns = self.nav.pct_change().dropna()
+        return pd.Series({
+            'total_return': self.nav.iloc[-1] / self.nav.iloc[0] - 1,
+            'annual_return': (self.nav.iloc[-1] / self.nav.iloc[0]) ** (1 / years) - 1 if years else np.nan,
+            'annual_vol': returns.std() * np.sqrt(252),
+            'annual_turnover': self.turnover.sum() / years if years else np.nan,
+            'total_costs': self.costs.sum(),
+        })
+
+    def risk_metrics(self, benchmark_data: pd.Series = None, confidence_level=0.05, window=252) -> pd.Series:
+        """The NAV run through the functions in risk_metrics, the same numbers we report for the fund"""
+        metrics = {
+            'monthly_vol': risk_metrics.monthly_vol(self.nav),
+            'semi_deviation': risk_metrics.semi_deviation(self.nav),
+            'VaR': risk_metrics.VaR(self.nav, confidence_level),
+            'CVaR': risk_metrics.CVaR(self.nav, confidence_level),
+            'maximum_drawdown': risk_metrics.maximum_drawdown(self.nav, window),
+            'pain_index': risk_metrics.pain_index(self.nav, window),
+        }
+        if benchmark_data is not None:
+            metrics['beta'] = risk_metrics.beta(self.nav, benchmark_data.loc[self.nav.index[0]:])
+        return pd.Series(metrics)
+
+
+def backtest(price_data: pd.DataFrame, rule, rebalance=21, cost_bps=10.0, warmup=0, initial=1.0,
+             keep_weights=True, **params) -> BacktestResult:
+    """Backtests a rule (a function or the name of one in RULES) on a DataFrame of prices, one column per stock.
+    Extra keyword arguments are passed on to the rule, e.g. backtest(prices, 'momentum', warmup=252, top=5)."""
+    rule = RULES[rule] if isinstance(rule, str) else rule
+    simulation = simulate(price_data.to_numpy(dtype=float), rule, params, rebalance=rebalance, cost_bps=cost_bps,
+                          warmup=warmup, initial=initial, keep_weights=keep_weights)
+    return BacktestResult(price_data, simulation)
+
+
+_prices = None
+
+
+def _init_worker(prices):
+    global _prices
+    _prices = (prices,) + _fill(prices)
+
+
+def _run_variant(args):
+    rule, params, settings = args
+    simulation = _simulate(*_prices, rule, params, settings['rebalance'], settings['cost_bps'], settings['warmup'],
+                           1.0, False)
+    return simulation['nav'], simulation['turnover'].sum(), simulation['costs'].sum()
+
+
+def _variants(grid) -> list:
+    if isinstance(grid, dict):
+        return [dict(zip(grid.keys(), values)) for values in itertools.product(*grid.values())]
+    return list(grid)
+
+
+def parameter_sweep(price_data: pd.DataFrame, rule, grid, rebalance=21, cost_bps=10.0, warmup=0, n_workers=None,
+                    chunksize=None, benchmark_data: pd.Series = None, confidence_level=0.05) -> pd.DataFrame:
+    """Backtests every variant of a rule and returns one row per variant with its parameters, turnover, costs and
+    risk metrics. grid is either a dict of lists (every combination is run) or a list of dicts; 'rebalance',
+    'cost_bps' and 'warmup' in a variant override the arguments, everything else goes to the rule.
+
+    The price array is sent to each worker of the process pool once, and the variants are handed out in chunks. The
+    risk metrics of all the NAVs are then computed together with panel_metrics."""
+    rule = RULES[rule] if isinstance(rule, str) else rule
+    prices = price_data.to_numpy(dtype=float)
+    settings = {'rebalance': rebalance, 'cost_bps': cost_bps, 'warmup': warmup}
+    variants = _variants(grid)
+    jobs = [(rule, {k: v for k, v in variant.items() if k not in settings},
+             {**settings, **{k: v for k, v in variant.items() if k in settings}}) for variant in variants]
+
+    n_workers = os.cpu_count() if n_workers is None else n_workers
+    if n_workers > 1 and len(jobs) > 1:
+        chunksize = chunksize or max(1, len(jobs) // (4 * n_workers))
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(jobs)), initializer=_init_worker,
+                                 initargs=(prices,)) as pool:
+            results = list(pool.map(_run_variant, jobs, chunksize=chunksize))
+    else:
+        _init_worker(prices)
+        results = [_run_variant(job) for job in jobs]
+
+    navs = pd.DataFrame(np.column_stack([nav for nav, _, _ in results]), index=price_data.index)
+    years = navs.notna().sum() / 252
+    first = navs.bfill().iloc[0]
+    table = pd.DataFrame(variants)
+    table['total_return'] = (navs.iloc[-1] / first - 1).to_numpy()
+    table['annual_return'] = ((navs.iloc[-1] / first) ** (1 / years) - 1).to_numpy()
+    table['annual_turnover'] = np.array([turnover for _, turnover, _ in results]) / years.to_numpy()
+    table['total_costs'] = [cost for _, _, cost in results]
+    metrics = risk_panel(navs, benchmark_data=benchmark_data, confidence_level=confidence_level)
+    return pd.concat([table, metrics.reset_index(drop=True)], axis=1)
+
+
+if __name__ == '__main__':
+    pass
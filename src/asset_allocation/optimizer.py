@@ -0,0 +1,217 @@
+# -----------------------------------------------------------
+# portfolio optimization: mean-variance, minimum variance, risk parity, CVaR and the efficient frontier
+#
+# Stevens Institute of Technology, Hoboken, New Jersey
+# Stevens Student Managed Investment Fund
+# -----------------------------------------------------------
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize, linprog
+from src.metrics.ssmif_datareader import DataReader
+from src.risk.risk_decomposition import covariance_model
+
+TOL = 1e-10
+
+
+def optimization_inputs(tickers, start, end, halflife=None, shrinkage='ledoit-wolf'):
+    """Returns the mean daily returns and the covariance matrix of daily returns for the tickers, from the cached
+    covariance models in risk_decomposition (so a daily rerun only folds in the new day)"""
+    model = covariance_model(tickers, start, end, halflife=halflife, shrinkage=shrinkage)
+    return pd.Series(model.mean, index=model.tickers), model.covariance
+
+
+def _bounds(value, n) -> np.ndarray:
+    return np.full(n, float(value)) if np.isscalar(value) else np.asarray(value, dtype=float)
+
+
+def critical_line(mu: pd.Series, cov: pd.DataFrame, lower=0.0, upper=1.0) -> list:
+    """Markowitz's critical line algorithm. Returns the corner portfolios of the long-only (or otherwise bounded)
+    efficient frontier as a list of (risk tolerance, weights) from the highest return portfolio down to the minimum
+    variance one. Between two neighbouring corners the optimal weights move in a straight line, so these few
+    portfolios describe the whole frontier exactly.
+
+    Each portfolio solves min 1/2 w'Cw - lambda * mu'w with the weights adding up to 1 and lower <= w <= upper. The
+    algorithm starts at lambda = infinity (all in the highest returning stocks) and lowers lambda, each step only
+    solving the small linear system for the stocks that aren't at a bound."""
+    mu_v, cov_v = mu.to_numpy(dtype=float), cov.loc[mu.index, mu.index].to_numpy(dtype=float)
+    n = len(mu_v)
+    lb, ub = _bounds(lower, n), _bounds(upper, n)
+    if lb.sum() > 1 + TOL or ub.sum() < 1 - TOL:
+        raise ValueError('the weight bounds leave no way for the weights to add up to 1')
+
+    # highest return portfolio: everything at its lower bound, then fill up the best stocks until the budget is used
+    w = lb.copy()
+    free = np.zeros(n, dtype=bool)
+    budget = 1 - lb.sum()
+    for i in np.argsort(-mu_v, kind='stable'):
+        add = min(ub[i] - lb[i], budget)
+        w[i] += add
+        budget -= add
+        if budget <= TOL:
+            free[i] = True
+            break
+
+    corners = [(np.inf, w.copy())]
+    lam = np.inf
+    for _ in range(10 * n + 10):
+        f, b = np.flatnonzero(free), np.flatnonzero(~free)
+        kkt = np.zeros((len(f) + 1, len(f) + 1))
+        kkt[:-1, :-1] = cov_v[np.ix_(f, f)]
+        kkt[:-1, -1] = kkt[-1, :-1] = 1.0
+        rhs = np.zeros((len(f) + 1, 2))
+        rhs[:-1, 0] = -cov_v[np.ix_(f, b)] @ w[b]
+        rhs[-1, 0] = 1 - w[b].sum()
+        rhs[:-1, 1] = mu_v[f]
+        (a_f, b_f) = (sol := np.linalg.solve(kkt, rhs))[:-1].T
+        a_nu, b_nu = sol[-1]
+
+        # the gradient of the lagrangian for every stock is c + lambda * d, it tells us when a stock at a bound
+        # would rather come off it
+        c = cov_v[:, f] @ a_f + cov_v[:, b] @ w[b] + a_nu
+        d = cov_v[:, f] @ b_f - mu_v + b_nu
+
+        events = []
+        with np.errstate(divide='ignore', invalid='ignore'):
+            to_lower = np.where(b_f > TOL, (lb[f] - a_f) / b_f, -np.inf)
+            to_upper = np.where(b_f < -TOL, (ub[f] - a_f) / b_f, -np.inf)
+            at_lower = ~free & (w <= lb + TOL)
+            off_lower = np.where(at_lower & (d > TOL), -c / d, -np.inf)
+            off_upper = np.where(~free & ~at_lower & (d < -TOL), -c / d, -np.inf)
+        for i, target in zip(f, to_lower):
+            events.append((target, i, 'lower'))
+        for i, target in zip(f, to_upper):
+            events.append((target, i, 'upper'))
+        for i in b:
+            events.append((max(off_lower[i], off_upper[i]), i, 'free'))
+        events = [e for e in events if e[0] < lam - TOL and e[0] > 0]
+
+        if not events:
+            w[f] = a_f
+            corners.append((0.0, w.copy()))
+            break
+        lam, i, kind = max(events, key=lambda e: e[0])
+        w[f] = a_f + lam * b_f
+        if kind == 'free':
+            free[i] = True
+        else:
+            free[i] = False
+            w[i] = lb[i] if kind == 'lower' else ub[i]
+        corners.append((lam, w.copy()))
+    return [(lam, pd.Series(weights, index=mu.index)) for lam, weights in corners]
+
+
+def _unconstrained_frontier(mu_v, cov_v, targets) -> np.ndarray:
+    """Weights of the fully invested frontier with no bounds on the weights (shorting allowed), closed form for
+    every target return at once"""
+    inv_one = np.linalg.solve(cov_v, np.ones(len(mu_v)))
+    inv_mu = np.linalg.solve(cov_v, mu_v)
+    a, b, c = inv_one @ mu_v, inv_mu @ mu_v, inv_one.sum()
+    d = b * c - a ** 2
+    return (np.outer(b - a * targets, inv_one) + np.outer(c * targets - a, inv_mu)) / d
+
+
+def efficient_frontier(mu: pd.Series, cov: pd.DataFrame, n_points=100, lower=0.0, upper=1.0,
+                       long_only=True) -> pd.DataFrame:
+    """Returns n_points portfolios evenly spaced in return along the efficient frontier, from the minimum variance
+    portfolio up to the highest return one, with their daily return, volatility and weights (one column per stock).
+
+    With bounds on the weights (long_only) the corner portfolios are found once with the critical line algorithm and
+    every point is a straight line interpolation between its two neighbouring corners. Without bounds the whole
+    frontier is in closed form."""
+    cov = cov.loc[mu.index, mu.index]
+    mu_v, cov_v = mu.to_numpy(dtype=float), cov.to_numpy(dtype=float)
+    if long_only:
+        corners = critical_line(mu, cov, lower=lower, upper=upper)
+        corner_weights = np.array([w.to_numpy() for _, w in corners])[::-1]  # minimum variance first
+        corner_returns = corner_weights @ mu_v
+        targets = np.linspace(corner_returns[0], corner_returns[-1], n_points)
+        segment = np.clip(np.searchsorted(corner_returns, targets) - 1, 0, len(corner_returns) - 2)
+        low, high = corner_returns[segment], corner_returns[segment + 1]
+        share = np.where(high > low, (targets - low) / np.where(high > low, high - low, 1.0), 0.0)
+        weights = corner_weights[segment] + share[:, None] * (corner_weights[segment + 1] - corner_weights[segment])
+    else:
+        inv_one = np.linalg.solve(cov_v, np.ones(len(mu_v)))
+        min_return = inv_one @ mu_v / inv_one.sum()
+        targets = np.linspace(min_return, max(mu_v.max(), min_return), n_points)
+        weights = _unconstrained_frontier(mu_v, cov_v, targets)
+
+    frontier = pd.DataFrame(weights, columns=mu.index)
+    frontier.insert(0, 'volatility', np.sqrt(np.einsum('ij,jk,ik->i', weights, cov_v, weights)))
+    frontier.insert(0, 'return', weights @ mu_v)
+    return frontier
+
+
+def mean_variance(mu: pd.Series, cov: pd.DataFrame, target_return=None, risk_aversion=1.0, lower=0.0,
+                  upper=1.0) -> pd.Series:
+    """Returns the mean-variance optimal weights, either the least risky portfolio with target_return or the one
+    maximizing mu'w - risk_aversion / 2 * w'Cw"""
+    corners = critical_line(mu, cov, lower=lower, upper=upper)
+    if target_return is not None:
+        returns = [w @ mu for _, w in corners]
+        if not returns[-1] - TOL <= target_return <= returns[0] + TOL:
+            raise ValueError('target_return has to be between {} and {}'.format(returns[-1], returns[0]))
+        for (_, w_high), (_, w_low), r_high, r_low in zip(corners, corners[1:], returns, returns[1:]):
+            if r_low - TOL <= target_return <= r_high + TOL:
+                share = 0.0 if r_high - r_low <= TOL else (target_return - r_low) / (r_high - r_low)
+                return w_low + share * (w_high - w_low)
+        return corners[0][1]
+
+    lam = 1 / risk_aversion
+    for (lam_high, w_high), (lam_low, w_low) in zip(corners, corners[1:]):
+        if lam_low <= lam <= lam_high:
+            if np.isinf(lam_high):
+                return w_high
+            return w_low + (lam - lam_low) / (lam_high - lam_low) * (w_high - w_low)
+    return corners[-1][1]
+
+
+def min_variance(cov: pd.DataFrame, lower=0.0, upper=1.0) -> pd.Series:
+    """Returns the minimum variance portfolio weights"""
+    # the critical line always ends at the minimum variance portfolio, whatever the returns are. Ranking the stocks
+    # by lowest volatility starts the line close to it (the returns can't all be equal or the line never moves)
+    mu = pd.Series(-np.sqrt(np.diag(cov.to_numpy(dtype=float))), index=cov.index)
+    return critical_line(mu, cov, lower=lower, upper=upper)[-1][1]
+
+
+def risk_parity(cov: pd.DataFrame, budgets=None) -> pd.Series:
+    """Returns the long-only weights where each stock's contribution to portfolio volatility matches its budget
+    (equal by default). Solved as the convex problem min 1/2 y'Cy - sum(b log y) and rescaled to add up to 1."""
+    cov_v = cov.to_numpy(dtype=float)
+    n = len(cov_v)
+    b = np.full(n, 1 / n) if budgets is None else np.asarray(budgets, dtype=float) / np.sum(budgets)
+    y0 = b / np.sqrt(np.diag(cov_v))
+    result = minimize(lambda y: 0.5 * y @ cov_v @ y - b @ np.log(y), y0, jac=lambda y: cov_v @ y - b / y,
+                      method='L-BFGS-B', bounds=[(1e-12, None)] * n, options={'ftol': 1e-15, 'gtol': 1e-12})
+    return pd.Series(result.x / result.x.sum(), index=cov.index)
+
+
+def min_CVaR(returns: pd.DataFrame, confidence_level=0.05, target_return=None, lower=0.0, upper=1.0) -> pd.Series:
+    """Returns the weights with the lowest historical CVaR over the scenarios in returns (rows are days, columns are
+    stocks), with Rockafellar and Uryasev's linear program. target_return is a minimum mean daily return."""
+    r = returns.dropna().to_numpy(dtype=float)
+    t, n = r.shape
+    lb, ub = _bounds(lower, n), _bounds(upper, n)
+    # variables: n weights, the VaR level, and t shortfalls below it
+    cost = np.concatenate([np.zeros(n), [1.0], np.full(t, 1 / (confidence_level * t))])
+    # every shortfall is at least -r_t . w - VaR
+    a_ub = np.hstack([-r, -np.ones((t, 1)), -np.eye(t)])
+    b_ub = np.zeros(t)
+    if target_return is not None:
+        a_ub = np.vstack([a_ub, np.concatenate([-r.mean(axis=0), [0.0], np.zeros(t)])])
+        b_ub = np.append(b_ub, -target_return)
+    a_eq = np.concatenate([np.ones(n), [0.0], np.zeros(t)])[None, :]
+    bounds = list(zip(lb, ub)) + [(None, None)] + [(0, None)] * t
+    result = linprog(cost, A_ub=a_ub, b_ub=b_ub, A_eq=a_eq, b_eq=[1.0], bounds=bounds, method='highs')
+    if not result.success:
+        raise ValueError('CVaR optimization failed: {}'.format(result.message))
+    return pd.Series(result.x[:n], index=returns.columns)
+
+
+def returns_panel(tickers, start, end) -> pd.DataFrame:
+    """Daily returns of the tickers, the scenarios min_CVaR works on"""
+    return DataReader(list(tickers), start=start, end=end)['Adj Close'].pct_change().iloc[1:]
+
+
+if __name__ == '__main__':
+    pass
@@ -1,12 +1,13 @@
 import sys
 import os
-from datetime import date
-import pandas_datareader as pdr
 import logging
 import json
+import sqlite3
 
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session
-from Metrics import *
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, Response, stream_with_context
+from src.metrics.screen import cached_screen, screen_universe, universe_rows, size_curve
+from src.metrics.screen_cache import screen_cache
+from src.metrics.screen_jobs import screen_jobs
 from changelog import changelog
 from Risk_API import holdings, transactions, accounts
 
@@ -64,15 +65,24 @@ def login():
 # Holdings
 @app.route('/api/holdings/getHoldings')
 def returnHoldings():
-    return jsonify(holdings.getHoldings())
+    # streamed straight from the database cursor, the client gets the first rows before the last are read
+    return Response(stream_with_context(holdings.streamHoldings()), mimetype='application/json')
 
 @app.route('/api/holdings/getHoldings/<ticker>')
 def returnHoldingsByTicker(ticker):
     return jsonify(holdings.getHoldingsByTicker(ticker))
 
+def returnCSV(entry):
+    # the body is already JSON and the etag says which version of the file it is, so a client that sends it back in
+    # If-None-Match gets a 304 with no body
+    response = Response(entry.body, mimetype='application/json')
+    response.set_etag(entry.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
 @app.route('/api/holdings/getHoldingsFromCSV')
 def returnHoldingsFromCSV():
-    return json.loads(holdings.getHoldingsFromCSV())
+    return returnCSV(holdings.holdingsCSV())
 
 
 
@@ -80,11 +90,11 @@ def returnHoldingsFromCSV():
 # Transactions
 @app.route('/api/transactions/getTransactions')
 def returnTransactions():
-    return jsonify(transactions.getTransactions())
+    return Response(stream_with_context(transactions.streamTransactions()), mimetype='application/json')
 
 @app.route('/api/transactions/getTransactionsFromCSV')
 def returnTransactionsFromCSV():
-    return json.loads(transactions.getTransactionsFromCSV())
+    return returnCSV(transactions.transactionsCSV())
 
 @app.route('/api/transactions/getTransactionsBefore/<inputtime>')
 def returnTransactionsBefore(inputtime):
@@ -94,9 +104,59 @@ def returnTransactionsBefore(inputtime):
 def returnTransactionsAfter(inputtime):
     return jsonify(transactions.getTransactionsAfterDate(int(inputtime)))
 
+# Paginated transaction queries, each returns {'transactions': [...], 'next': cursor}. Pass the cursor back as ?cursor=
+# to get the next page, next is null on the last one. ?limit= sets the page size (500 by default, 1 to 5000). A limit,
+# cursor or timestamp that isn't a number gets a 400.
+def returnTransactionsPage(start=None, end=None, symbol=None, trade_type=None):
+    try:
+        rows, next_cursor = transactions.queryTransactions(start=start, end=end, symbol=symbol, trade_type=trade_type,
+                                                            limit=int(request.args.get('limit', 500)),
+                                                            cursor=request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'transactions': rows, 'next': next_cursor})
+
+def timestamp(value):
+    # a timestamp from the url, None if it wasn't given
+    return None if value is None else int(value)
+
+@app.route('/api/transactions/getTransactionsBetween/<starttime>/<endtime>')
+def returnTransactionsBetween(starttime, endtime):
+    try:
+        start, end = timestamp(starttime), timestamp(endtime)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return returnTransactionsPage(start=start, end=end)
+
+@app.route('/api/transactions/getTransactionsBySymbol/<symbol>')
+def returnTransactionsBySymbol(symbol):
+    return returnTransactionsPage(symbol=symbol)
+
+@app.route('/api/transactions/getTransactionsByType/<transtype>')
+def returnTransactionsByType(transtype):
+    return returnTransactionsPage(trade_type=transtype)
+
+@app.route('/api/transactions/query')
+def returnTransactionsQuery():
+    # any mix of ?start=&end= (timestamps), ?symbol= and ?type=
+    try:
+        start, end = timestamp(request.args.get('start')), timestamp(request.args.get('end'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return returnTransactionsPage(start=start, end=end, symbol=request.args.get('symbol'),
+                                  trade_type=request.args.get('type'))
+
 @app.route('/api/transactions/newTransaction', methods=['POST'])
 def addNewTransactions():
-    transactions.newTransaction(request.form['transDate'], request.form['transType'], request.form['symbol'], request.form['prodDesc'], request.form['units'], request.form['grossAmt'], request.form['transFee'], request.form['netAmt'])
+    try:
+        added = transactions.newTransaction(request.form['transDate'], request.form['transType'], request.form['symbol'], request.form['prodDesc'], request.form['units'], request.form['grossAmt'], request.form['transFee'], request.form['netAmt'], new_fill=bool(request.form.get('newFill')))
+    except (KeyError, ValueError, IndexError, sqlite3.IntegrityError) as e:
+        # a missing field, a date that isn't YYYY-MM-DD or an empty required value
+        logging.info(e)
+        return 'bad transaction', 400
+    if not added:
+        # the page asks whether it is another identical fill and sends it again with newFill set if it is
+        return 'transaction already exists', 409
     return 'success'
 
 
@@ -104,136 +164,85 @@ def addNewTransactions():
 
 @app.route('/screen-backend', methods=['POST'])
 def backend():
-    """The backend end to the form on screen.html. The form data gets POSTed here via AJAX and creates a list of metric values which gets sent back in JSON in the form of {[],[]...}."""
-    metric_data = []
-
-    # global status
-    # num_metrics = 11
-    # status = {'metric':'None', 'num':-1, 'total':num_metrics, 'status':'start'}
-
-    try:
-        # status = {'metric':'Data Collection', 'num':0, 'total': num_metrics, 'status':'ok'}
-        today = date.today()
-        ticker_data = pdr.get_data_yahoo(request.form['ticker'], str(today.replace(year = today.year - int(request.form['years']))))
-        sector_data = pdr.get_data_yahoo(request.form['sector'], str(today.replace(year = today.year - int(request.form['years']))))
-        spy_data = pdr.get_data_yahoo("^GSPC", str(today.replace(year = today.year - int(request.form['years']))))
-    except Exception as e:
-        metric_data.append("Error")
-        logging.info(e)
-        # status = {'metric':'Error', 'num':-2, 'total':num_metrics, 'status':'error'}
-        return jsonify(metric_data)
-
-
+    """The backend end to the form on screen.html. The form data gets POSTed here via AJAX and creates a list of metric values which gets sent back in JSON in the form of {[],[]...}.
+    The ticker, sector and S&P 500 prices are pulled at the same time and the metrics run in parallel, see src/metrics/screen.py. Each metric also says how many seconds it took.
+    Results are cached for the trading day until our holdings or transactions change, so re-running a recent search is instant."""
     try:
-        # status = {'metric':'Portfolio VaR', 'num':1, 'total': num_metrics, 'status':'ok'}
-        value = CalcPortfolioVar.calcPortfolioVar(timeRange = int(request.form['years']), marginalTicker = request.form['ticker']) * 100
-        if(value > 15):
-            pf = "fail"
-        else:
-            pf = "pass"
-        metric_data.append({'metric': 'Portfolio VaR w/ ' + request.form['ticker'], 'value' : '{0:.3g}%'.format(value), 'pf':pf})
+        metric_data = cached_screen(request.form['ticker'], request.form['sector'], int(request.form['years']))
     except Exception as e:
-        metric_data.append({'metric': 'Portfolio VaR w/ ' + request.form['ticker'], 'value' : "Error", 'pf':""})
-        logging.info('Portfolio VaR: ')
-        logging.info(e)
-
-    try:
-        # status = {'metric':'Portfolio CVaR', 'num':2, 'total': num_metrics, 'status':'ok'}
-        value = CalcPortfolioCvar.calcPortfolioCvar(timeRange = int(request.form['years']), marginalTicker = request.form['ticker']) * 100
-        metric_data.append({'metric': 'Portfolio CVaR w/ ' + request.form['ticker'], 'value' : '{0:.3g}%'.format(value), 'pf':""})
-    except Exception as e:
-        metric_data.append({'metric': 'Portfolio CVaR w/ ' + request.form['ticker'], 'value' : "Error", 'pf':""})
-        logging.info('Portfolio CVaR: ')
-        logging.info(e)
-
-    try:
-        # status = {'metric':'Monthly VaR', 'num':3, 'total': num_metrics, 'status':'ok'}
-        value = CalcVar.calcVar(ticker_data) * 100
-        metric_data.append({'metric': 'Monthly VaR', 'value' : '{0:.3g}%'.format(value), 'pf':""})
-    except Exception as e:
-        metric_data.append({'metric': 'Monthly VaR', 'value' : "Error", 'pf':""})
-        logging.info('Monthly VaR: ')
         logging.info(e)
+        return jsonify(["Error"])
+    return jsonify(metric_data)
 
-    try:
-        # status = {'metric':'Monthly CVaR', 'num':4, 'total': num_metrics, 'status':'ok'}
-        value = CalcCvar.calcCvar(ticker_data) * 100
-        metric_data.append({'metric': 'Monthly CVaR', 'value' : '{0:.3g}%'.format(value), 'pf':""})
-    except Exception as e:
-        metric_data.append({'metric': 'Monthly CVaR', 'value' : "Error", 'pf':""})
-        logging.info('Monthly CVaR: ')
-        logging.info(e)
+@app.route('/api/screen/cacheStats')
+def returnScreenCacheStats():
+    return jsonify(screen_cache.stats())
 
+# Screen jobs, for screens that shouldn't hold a request open. POST the same form as /screen-backend to start one and
+# get back {'job': id}, then either poll /screen-jobs/<id> or follow /screen-jobs/<id>/events, which sends the job's
+# status as server-sent events while the metrics come in: {'state', 'num', 'total', 'metric', 'results', 'error'},
+# results having a row per metric (null until it is done) and state going queued, running, then done or error.
+@app.route('/screen-jobs', methods=['POST'])
+def submitScreenJob():
     try:
-        # status = {'metric':'Monthly Semi Dev', 'num':5, 'total': num_metrics, 'status':'ok'}
-        value = semi_deviation.semi_deviation(ticker_data) * 100
-        metric_data.append({'metric': 'Monthly Semi Dev', 'value' : '{0:.3g}%'.format(value), 'pf':""})
-    except Exception as e:
-        metric_data.append({'metric': 'Monthly Semi Dev', 'value' : "Error", 'pf':""})
-        logging.info('Monthly Semi Dev: ')
+        job_id = screen_jobs.submit(request.form['ticker'], request.form['sector'], int(request.form['years']))
+    except (KeyError, ValueError) as e:
         logging.info(e)
+        return jsonify(["Error"]), 400
+    return jsonify({'job': job_id}), 202
 
+@app.route('/screen-jobs/<job_id>')
+def returnScreenJob(job_id):
     try:
-        # status = {'metric':'Daily Max Drawdown', 'num':6, 'total': num_metrics, 'status':'ok'}
-        value = maximum_drawdown.max_drawdown(ticker_data) * 100
-        metric_data.append({'metric': 'Daily Max Drawdown', 'value' : '{0:.3g}%'.format(value), 'pf':""})
-    except Exception as e:
-        metric_data.append({'metric': 'Daily Max Drawdown', 'value' : "Error", 'pf':""})
-        logging.info('Daily Max Drawdown: ')
-        logging.info(e)
+        return jsonify(screen_jobs.status(job_id))
+    except KeyError:
+        return jsonify(["Error"]), 404
 
+@app.route('/screen-jobs/<job_id>/events')
+def returnScreenJobEvents(job_id):
     try:
-        # status = {'metric':'Monthly Pain Index', 'num':7, 'total': num_metrics, 'status':'ok'}
-        value = pain_index.pain_index(ticker_data, spy_data) * 100
-        metric_data.append({'metric': 'Monthly Pain Index', 'value' : '{0:.3g}%'.format(value), 'pf':""})
-    except Exception as e:
-        metric_data.append({'metric': 'Monthly Pain Index', 'value' : "Error", 'pf':""})
-        logging.info('Monthly Pain Index: ')
-        logging.info(e)
-
+        events = screen_jobs.events(job_id)
+    except KeyError:
+        return jsonify(["Error"]), 404
+
+    def stream():
+        for status in events:
+            # a comment line every so often keeps proxies from closing a quiet connection
+            yield ': keep-alive\n\n' if status is None else 'data: {}\n\n'.format(json.dumps(status))
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/screen/universe', methods=['POST'])
+def returnUniverseScreen():
+    """Screens a list of candidates at once. Takes JSON, either {'tickers': [...], 'sector': 'XLK', 'years': 3} or a sector-grouped
+    {'universe': {'XLK': [...], 'XLE': [...]}, 'years': 3}, and an optional 'weight' to add each one at. Returns {'results': [...], 'missing': [...]},
+    a row per ticker in rank order ({'rank', 'ticker', 'sector', 'pf', 'metrics'} with the metrics as in /screen-backend) and the tickers with no prices.
+    Everything is pulled in one pass and each metric runs over all the tickers together, see screen_universe in src/metrics/screen.py."""
+    form = request.get_json(force=True)
+    universe = form.get('universe') or form.get('tickers')
+    if not universe or 'years' not in form:
+        return jsonify(["Error"]), 400
     try:
-        # status = {'metric':'Monthly Beta', 'num':8, 'total': num_metrics, 'status':'ok'}
-        value = beta.beta(ticker_data, spy_data)
-        metric_data.append({'metric': 'Monthly Beta', 'value' : '{0:.3g}'.format(value), 'pf':""})
+        table, missing = screen_universe(universe, int(form['years']), sector=form.get('sector'), weight=None if form.get('weight') is None else float(form['weight']))
     except Exception as e:
-        metric_data.append({'metric': 'Monthly Beta', 'value' : "Error", 'pf':""})
-        logging.info('Monthly Beta: ')
         logging.info(e)
+        return jsonify(["Error"])
+    return jsonify({'results': universe_rows(table), 'missing': missing})
 
+@app.route('/api/screen/sizeCurve', methods=['POST'])
+def returnSizeCurve():
+    """Portfolio VaR, CVaR and volatility with the ticker added at 0 to 10% of the book, for the same form as /screen-backend. Returns
+    [{'weight', 'VaR', 'CVaR', 'volatility', 'pf'}, ...], each size an update of the day's base portfolio so the whole curve takes milliseconds."""
     try:
-        # status = {'metric':'Sector Beta', 'num':9, 'total': num_metrics, 'status':'ok'}
-        value = sector_beta.call_sector_beta(ticker_data, request.form['ticker'], int(request.form['years']), sector_data)
-        metric_data.append({'metric': 'Sector Beta', 'value' : '{0:.3g}'.format(value), 'pf':""})
+        curve = size_curve(request.form['ticker'], int(request.form['years']))
     except Exception as e:
-        metric_data.append({'metric': 'Sector Beta', 'value' : "Error", 'pf':""})
-        logging.info('Sector Beta: ')
         logging.info(e)
+        return jsonify(["Error"])
+    return jsonify(curve)
 
-    try:
-        # status = {'metric':'Monthly Variance', 'num':10, 'total': num_metrics, 'status':'ok'}
-        value = monthly_variance.call_monthly_variance(ticker_data) * 100
-        metric_data.append({'metric': 'Monthly Variance', 'value' : '{0:.3g}%'.format(value), 'pf':""})
-    except Exception as e:
-        metric_data.append({'metric': 'Monthly Variance', 'value' : "Error", 'pf':""})
-        logging.info('Monthly Variance: ')
-        logging.info(e)
-
-    try:
-        # status = {'metric':'Monthly Historical Volatility', 'num':11, 'total': num_metrics, 'status':'ok'}
-        value = CalcMonthlyVolatility.calcMonthlyVolatility(ticker_data) * 100
-        metric_data.append({'metric': 'Monthly Historical Volatility', 'value' : '{0:.3g}%'.format(value), 'pf':""})
-    except Exception as e:
-        metric_data.append({'metric': 'Monthly Historical Volatility', 'value' : "Error", 'pf':""})
-        logging.info('Historical Volatility: ')
-        logging.info(e)
-
-    # try:
-    #     metric_data.append({'metric': 'GICS Sector', 'value' : get_sector(request.form['ticker']), 'pf':""})
-    # except:
-    #     metric_data.append({'metric': 'GICS Sector', 'value' : "Error", 'pf':""})
-
-    # status = {'metric':'Done', 'num':-1, 'total': num_metrics, 'status':'finish'}
-    return jsonify(metric_data)
+@app.route('/api/screen/jobStats')
+def returnScreenJobStats():
+    return jsonify(screen_jobs.stats())
 
 if __name__ == '__main__':
     app.run()
\ No newline at end of file
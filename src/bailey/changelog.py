@@ -1,4 +1,4 @@
-changelog = [{'version':'2.4.6', 'changes':'get holdings and transactions from csv api enpoint'}, {'version':'2.4.5', 'changes':'getLastStockPrice bug fix'},{'version':'2.4.4', 'changes':'Bug Fixes.'}, {'version':'2.4.3', 'changes':'Database current holdings updated.'}, {'version':'2.4.2', 'changes':'Stop Loss values added to database.'}, {'version':'2.4.1', 'changes':'Portfolio VaR and CVaR calculate correctly. Not sure what happened but it\'s fixed.'},{'version':'2.4.0', 'changes':'New Senior Management and Admin logins. Senior Management has the ability to add new transactions on the holdings page. This form only adds to the transactions database. It doesn\'t do anything else yet. Index.html has been renamed to screen.html. Login authentication now returns permissions.'}, {'version':'2.3.0', 'changes':'Stop_Loss column added to holdings table in database. Viewable on holdings page. Also accessible through holdings API.'}, {'version':'2.2.1', 'changes':'Bailey'}, {'version':'2.2.0', 'changes': 'New login screen. This was required in order to allow access to the api from external sources. Pretty basic right now, same credentials.'}, {'version':'2.1.1', 'changes':'Added new holdings endpoint: getHoldings/<ticker> will return holdings information about just that ticker. It will return an empty list is we do not hold that ticker.'}, {'version':'2.1.0','changes':'Added two new endpoints to the API: getTransactionsAfter and getTransactionsBefore. They both take in a timestamp.'}, {'version':'2.0.2', 'changes':'Holdings table looks a lot nicer.'}, {'version':'2.0.1', 'changes':'API endpoint address bug fix.'}, {'version':'2.0.0', 'changes':'Database being built to replace old one or to have redundancy if it comes back up. Database is coming with a work-in-progress API in order to connect to pull from the database.'}, {'version':'1.4.0', 'changes':'New changelog page. Added recent searchs under form that can be clicked to be reran.'}, {'version':'1.3.1', 'changes':'Changelog now visible.'}, {'version':'1.3.0', 'changes':"Portfolio VaR and CVaR will only backtest to as far as data exists in the time frame. "}, {'version':'1.2.0', 'changes':'Risk Screen now runs faster due to more efficent Portfolio VaR and CVaR functions.'}, {'version':'1.0.1', 'changes':"Portfolio VaR and CVaR now show 'w/ ticker' and waiting messages while screen is running."}, {'version':'1.0.0', 'changes':'Initial Release.'}]
+changelog = [{'version':'2.9.0', 'changes':'Portfolio VaR and CVaR on the Risk Screen are worked out against a copy of the portfolio that is rebuilt once a day, so they come back in milliseconds. Under the results, the screen now shows portfolio VaR, CVaR and volatility with the stock at 0 to 10% of the book (also at /api/screen/sizeCurve).'}, {'version':'2.8.0', 'changes':'Batch screening: POST a list of tickers, or tickers grouped by sector ETF, to /api/screen/universe. Every candidate gets the Risk Screen metrics and a pass/fail, ranked by how much portfolio VaR it adds. Prices are pulled once for the whole list, so a few hundred names take seconds.'}, {'version':'2.7.0', 'changes':'Risk Screen runs as a background job. The page fills in each metric as it finishes and shows how many are done, instead of waiting on one long request. POST to /screen-jobs to start a screen, then poll /screen-jobs/<id> or follow /screen-jobs/<id>/events. /screen-backend still works.'}, {'version':'2.6.1', 'changes':'Risk Screen results are cached for the trading day, so re-running a recent search comes back instantly. The cache empties whenever holdings or transactions change. Hit and miss counts are at /api/screen/cacheStats.'}, {'version':'2.6.0', 'changes':'Risk Screen pulls the ticker, sector and S&P 500 prices at the same time and runs the metrics in parallel, so it comes back a lot faster. Portfolio VaR and CVaR share one portfolio calculation, and every metric reports how long it took.'}, {'version':'2.5.2', 'changes':'getHoldingsFromCSV and getTransactionsFromCSV are cached until the csv changes and send an ETag, so polling them again returns 304 Not Modified when nothing changed.'}, {'version':'2.5.1', 'changes':'getHoldings and getTransactions stream their JSON as it is read from the database, so big exports start right away and don\'t use up memory.'}, {'version':'2.5.0', 'changes':'New paginated transaction endpoints: getTransactionsBetween/<start>/<end>, getTransactionsBySymbol/<symbol>, getTransactionsByType/<type> and query?start=&end=&symbol=&type=. Each returns a page of transactions and a cursor for the next page. The transactions table is now indexed by date, symbol and type.'}, {'version':'2.4.7', 'changes':'Database connections are pooled and reused between requests, and the database runs in WAL mode so the dashboard can read while transactions are written.'}, {'version':'2.4.6', 'changes':'get holdings and transactions from csv api enpoint'}, {'version':'2.4.5', 'changes':'getLastStockPrice bug fix'},{'version':'2.4.4', 'changes':'Bug Fixes.'}, {'version':'2.4.3', 'changes':'Database current holdings updated.'}, {'version':'2.4.2', 'changes':'Stop Loss values added to database.'}, {'version':'2.4.1', 'changes':'Portfolio VaR and CVaR calculate correctly. Not sure what happened but it\'s fixed.'},{'version':'2.4.0', 'changes':'New Senior Management and Admin logins. Senior Management has the ability to add new transactions on the holdings page. This form only adds to the transactions database. It doesn\'t do anything else yet. Index.html has been renamed to screen.html. Login authentication now returns permissions.'}, {'version':'2.3.0', 'changes':'Stop_Loss column added to holdings table in database. Viewable on holdings page. Also accessible through holdings API.'}, {'version':'2.2.1', 'changes':'Bailey'}, {'version':'2.2.0', 'changes': 'New login screen. This was required in order to allow access to the api from external sources. Pretty basic right now, same credentials.'}, {'version':'2.1.1', 'changes':'Added new holdings endpoint: getHoldings/<ticker> will return holdings information about just that ticker. It will return an empty list is we do not hold that ticker.'}, {'version':'2.1.0','changes':'Added two new endpoints to the API: getTransactionsAfter and getTransactionsBefore. They both take in a timestamp.'}, {'version':'2.0.2', 'changes':'Holdings table looks a lot nicer.'}, {'version':'2.0.1', 'changes':'API endpoint address bug fix.'}, {'version':'2.0.0', 'changes':'Database being built to replace old one or to have redundancy if it comes back up. Database is coming with a work-in-progress API in order to connect to pull from the database.'}, {'version':'1.4.0', 'changes':'New changelog page. Added recent searchs under form that can be clicked to be reran.'}, {'version':'1.3.1', 'changes':'Changelog now visible.'}, {'version':'1.3.0', 'changes':"Portfolio VaR and CVaR will only backtest to as far as data exists in the time frame. "}, {'version':'1.2.0', 'changes':'Risk Screen now runs faster due to more efficent Portfolio VaR and CVaR functions.'}, {'version':'1.0.1', 'changes':"Portfolio VaR and CVaR now show 'w/ ticker' and waiting messages while screen is running."}, {'version':'1.0.0', 'changes':'Initial Release.'}]
 
 
 # The date is currently november 22. We are in babbio 321. We are all pregaming the christmas party that we are having at Greg's appartment. Can't wait for secret santa. We are watching the Trans-athlete episode of South Park that aired recently. We are supposed to be commenting code, but I think we are checked out. That's why I'm writing this in my...current state. I want to keep the screen professional, but I also want to meme it. We're ordering food. I think we're gonna Ice Greg in his appartment. I should add easter eggs. Maybe add a fun changelog entry. Greg showed Equity the new risk screen updates and showed them the changelog and told them we were building a database. PS Juan doesn't speak english.
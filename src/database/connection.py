@@ -0,0 +1,135 @@
+import sqlite3
+import os
+import json
+import threading
+import queue
+from pathlib import Path
+from itertools import islice
+from contextlib import contextmanager
+
+dbfile = os.environ.get('SSMIF_RISK_DB', os.path.join(Path(__file__).parent.absolute(), "database/Risk.db"))
+
+# WAL lets the dashboard keep reading while a transaction is being written, NORMAL sync is safe with WAL and skips
+# an fsync per commit, and busy_timeout makes a second writer wait instead of failing with "database is locked"
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -16000,  # 16MB
+    'temp_store': 'MEMORY',
+    'mmap_size': 64 * 1024 * 1024,
+}
+
+
+class ConnectionPool:
+    """Hands out open sqlite connections to the database so API requests don't pay for sqlite3.connect every time.
+
+    A thread gets one connection for as long as it holds it (nested connection() calls on the same thread get the
+    same one) and gives it back to the pool when it is done, so the flask threads that come and go per request reuse
+    the same few connections. Connections run in autocommit mode, so reads never sit in an open transaction, and
+    writes go through transaction()."""
+
+    def __init__(self, path=dbfile, size=8):
+        self.path = path
+        self.size = size
+        self.__idle = queue.LifoQueue()
+        self.__local = threading.local()
+        self.__lock = threading.Lock()
+        self.__opened = 0
+
+    def __open(self):
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, cached_statements=256)
+        for pragma, value in PRAGMAS.items():
+            conn.execute("PRAGMA {} = {};".format(pragma, value))
+        return conn
+
+    @contextmanager
+    def connection(self):
+        held = getattr(self.__local, 'conn', None)
+        if held is not None:
+            yield held
+            return
+
+        try:
+            conn = self.__idle.get_nowait()
+        except queue.Empty:
+            with self.__lock:
+                can_open = self.__opened < self.size
+                self.__opened += can_open
+            conn = self.__open() if can_open else self.__idle.get()
+        self.__local.conn = conn
+        try:
+            yield conn
+        finally:
+            self.__local.conn = None
+            if conn.in_transaction:
+                conn.rollback()
+            self.__idle.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """A write transaction, committed if the block finishes and rolled back if it raises. BEGIN IMMEDIATE takes
+        the write lock up front so two writers queue up instead of deadlocking halfway through."""
+        with self.connection() as conn:
+            if conn.in_transaction:
+                yield conn
+                return
+            conn.execute("BEGIN IMMEDIATE;")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def query(self, sql, params=()):
+        """Runs a parameterized SELECT and returns all the rows"""
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def close(self):
+        """Closes every idle connection, e.g. before the database file is replaced"""
+        while True:
+            try:
+                conn = self.__idle.get_nowait()
+            except queue.Empty:
+                return
+            conn.close()
+            with self.__lock:
+                self.__opened -= 1
+
+
+pool = ConnectionPool()
+connection = pool.connection
+transaction = pool.transaction
+query = pool.query
+
+
+def dictRow(cursor, row):
+    # row factory that gives each row as a {column: value} dict
+    return dict(zip([column[0] for column in cursor.description], row))
+
+
+def streamRows(sql, params=(), arraysize=500):
+    """Yields the rows of a SELECT as dicts, arraysize at a time from the cursor, so a whole table is never in memory
+    at once. The connection is held until the generator is finished or closed."""
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = dictRow
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(arraysize)
+            if not rows:
+                return
+            yield from rows
+
+
+def jsonChunks(rows, chunk_size=500):
+    """Encodes rows as a JSON list a chunk of chunk_size rows at a time, for streaming a response"""
+    rows = iter(rows)
+    yield '['
+    separator = ''
+    for chunk in iter(lambda: list(islice(rows, chunk_size)), []):
+        yield separator + json.dumps(chunk)[1:-1]
+        separator = ','
+    yield ']'
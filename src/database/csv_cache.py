@@ -0,0 +1,53 @@
+import os
+import time
+import hashlib
+import threading
+from collections import namedtuple
+import pandas as pd
+
+CSVEntry = namedtuple('CSVEntry', ['key', 'frame', 'body', 'etag'])
+
+
+def toTimestamps(dates):
+    # the broker files use m/d/Y dates, stored as local midnight unix timestamps like time.mktime gives. Only the
+    # distinct days are parsed (in one go) and run through mktime, every row then just looks its day up
+    days = pd.unique(dates)
+    stamps = {day: int(time.mktime(d.timetuple())) for day, d in zip(days, pd.to_datetime(days, format="%m/%d/%Y"))}
+    return dates.map(stamps).astype('int64')
+
+
+class CSVCache:
+    """Keeps the parsed frame and the JSON response body of each CSV the API serves, keyed on the file's
+    modification time and size. A request only re-reads the file after it has changed; otherwise it costs one
+    os.stat. The etag is a hash of the body, so a client that already has it can be answered with 304 Not Modified."""
+
+    def __init__(self):
+        self.__entries = {}
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, parse) -> CSVEntry:
+        """The entry for the CSV at path, parse(path) turns the file into the frame to serve"""
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self.__lock:
+            entry = self.__entries.get(path)
+            if entry is not None and entry.key == key:
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        frame = parse(path)
+        body = frame.to_json(orient="records").encode()
+        entry = CSVEntry(key, frame, body, hashlib.sha1(body).hexdigest())
+        with self.__lock:
+            self.__entries[path] = entry
+        return entry
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return {'files': len(self.__entries), 'hits': self.hits, 'misses': self.misses}
+
+
+csv_cache = CSVCache()
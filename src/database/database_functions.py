@@ -1,19 +1,17 @@
-import sqlite3
 import sys
 import os
 from pathlib import Path
 import pandas as pd
-import time
-import datetime
 sys.path.append(os.path.join(Path(__file__).parent.absolute().parent.absolute(), "General_Utility_Functions"))
 from GetCurrentPositions import getCurrentPositions
+from .connection import connection, transaction
+from .transactions import transactionsIndexes
+from .csv_cache import toTimestamps
 
 def creatHoldings():
 
-    conn = sqlite3.connect('database/Risk.db')
-
-    c = conn.cursor()
-    c.execute("""CREATE TABLE IF NOT EXISTS `current_holdings` (
+    with transaction() as conn:
+        conn.execute("""CREATE TABLE IF NOT EXISTS `current_holdings` (
 	`Ticker` VARCHAR(10) NOT NULL,
 	`Company` VARCHAR(1000) NOT NULL,
 	`Sector` VARCHAR(500) NOT NULL,
@@ -29,48 +27,47 @@ def creatHoldings():
 	`Month_Open_Position_Value` DECIMAL (10, 2),
 	PRIMARY KEY (`Ticker`));""")
 
-    conn.commit()
-
-    conn.close()
-
-def fillHoldings():
-    holdingsFile = os.path.join(Path(__file__).parent.absolute(), "../General_Utility_Functions/Necessary_Info/Portfolio_Holdings.csv")
-    holdings = pd.read_csv(holdingsFile)
-
-    conn = sqlite3.connect('database/Risk.db')
-    c = conn.cursor()
-
-    for index, row in holdings.iterrows():
-        new_date = int(time.mktime(datetime.datetime.strptime(row['Original Purchase Date'], "%m/%d/%Y").timetuple()))
-        ticker = row['Ticker']
-        company = row['Company']
-        sector = row['Sector']
-        shares = int(row['Shares'])
-        VWAP = float(row['Entry VWAP'])
-        Invested_Amount = float(row['Invested Amount'])
-        curr_value = float(row['Current Value (Mark-to-Market)'])
-        year_price = float(row['Year Open Price'])
-        try:
-            year_pos = float(row['Year Open Position Value'])
-        except:
-            year_pos = 'null'
-        month_price = float(row['Month Open Price'])
-        month_pos = float(row['Month Open Position Value'])
-        ex = """INSERT INTO current_holdings VALUES ('{}', '{}', '{}', {}, {}, {}, {}, {}, {}, {}, {}, {}, {});""".format(ticker, company, sector, new_date, shares, VWAP, Invested_Amount, 0, curr_value, year_price, year_pos, month_price, month_pos)
-        c.execute(ex)
-
-    conn.commit()
-
-    conn.close()
+HOLDINGS_COLUMNS = ['Ticker', 'Company', 'Sector', 'Original Purchase Date', 'Shares', 'Entry VWAP', 'Invested Amount',
+                    'Current Value (Mark-to-Market)', 'Year Open Price', 'Year Open Position Value', 'Month Open Price',
+                    'Month Open Position Value']
+
+TRANSACTION_COLUMNS = ['Trade Date', 'Type', 'Symbol', 'Product Description', 'Units', 'Gross Amount', 'Transaction Fee',
+                       'Net Amount']
+TEXT_COLUMNS = ['Type', 'Symbol', 'Product Description']
+
+def toRecords(frame):
+    # plain python values with None for anything missing, the way sqlite3 wants its parameters
+    frame = frame.astype(object).where(frame.notna(), None)
+    return list(frame.itertuples(index=False, name=None))
+
+def fillHoldings(holdingsFile=os.path.join(Path(__file__).parent.absolute(), "../General_Utility_Functions/Necessary_Info/Portfolio_Holdings.csv")):
+    # upserts every position on its ticker and drops positions that are no longer in the file, so running it again
+    # with the same file changes nothing. Stop losses are left alone, they come from addStopLoss
+    holdings = pd.read_csv(holdingsFile, usecols=HOLDINGS_COLUMNS)
+    holdings['Original Purchase Date'] = toTimestamps(holdings['Original Purchase Date'])
+    numbers = HOLDINGS_COLUMNS[4:]
+    holdings[numbers] = holdings[numbers].apply(pd.to_numeric, errors='coerce')
+    holdings['Shares'] = holdings['Shares'].astype('int64')
+    holdings.insert(7, 'Stop_Loss', 0)
+
+    with transaction() as conn:
+        conn.executemany("""INSERT INTO current_holdings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                            ON CONFLICT(Ticker) DO UPDATE SET Company = excluded.Company, Sector = excluded.Sector,
+                            Original_Purchase_Date = excluded.Original_Purchase_Date, Shares = excluded.Shares,
+                            Entry_VWAP = excluded.Entry_VWAP, Invested_Amount = excluded.Invested_Amount,
+                            Current_Value_MTM = excluded.Current_Value_MTM, Year_Open_Price = excluded.Year_Open_Price,
+                            Year_Open_Position_Value = excluded.Year_Open_Position_Value,
+                            Month_Open_Price = excluded.Month_Open_Price,
+                            Month_Open_Position_Value = excluded.Month_Open_Position_Value;""", toRecords(holdings))
+        conn.execute("""DELETE FROM current_holdings WHERE Ticker NOT IN (SELECT value FROM json_each(?));""",
+                     (holdings['Ticker'].to_json(orient='values'),))
 
 # fillHoldings()
 
 def transactionsTable():
 
-    conn = sqlite3.connect('database/Risk.db')
-
-    c = conn.cursor()
-    c.execute("""CREATE TABLE IF NOT EXISTS `transactions` (
+    with transaction() as conn:
+        conn.execute("""CREATE TABLE IF NOT EXISTS `transactions` (
 	`Trade_Date` TIMESTAMP NOT NULL,
 	`Type` VARCHAR(100) NOT NULL,
 	`Symbol` VARCHAR(10) NOT NULL,
@@ -78,58 +75,59 @@ def transactionsTable():
 	`Units` INT DEFAULT '0',
 	`Gross_Amount` DECIMAL (10, 2) NOT NULL,
 	`Transaction_Fee` DECIMAL (10, 2) DEFAULT '0',
-	`Net_Amount` DECIMAL (10, 2) NOT NULL);""")
-
-    conn.commit()
-
-    conn.close()
+	`Net_Amount` DECIMAL (10, 2) NOT NULL,
+	`Occurrence` INT NOT NULL DEFAULT 0);""")
+        transactionsKey(conn)
+        transactionsIndexes(conn)
 
 # transactionsTable()
 
-def fillTransaction():
-
-    transactionsFile = os.path.join(Path(__file__).parent.absolute(), "../General_Utility_Functions/Necessary_Info/Transactions_This_Year.csv")
-    transactions = pd.read_csv(transactionsFile)
-
-    conn = sqlite3.connect('database/Risk.db')
-
-    c = conn.cursor()
-
-    for i in range(transactions.shape[0] - 1, -1, -1):
-        row = transactions.iloc[i]
-        new_date = int(time.mktime(datetime.datetime.strptime(row['Trade Date'], "%m/%d/%Y").timetuple()))
-        net_amount = float(row['Net Amount'])
-
-        if(pd.isna(row['Units'])):
-            units = 0
-        else:
-            units = int(row['Units'])
-
-
-        if(pd.isna(row['Gross Amount'])):
-            gross_amount = 0
-        else:
-            gross_amount = float(row['Gross Amount'])
-
-
-        if(pd.isna(row['Transaction Fee'])):
-            trans_fee = 0
-        else:
-            trans_fee = float(row['Transaction Fee'])
-
-
-
-        ex = """INSERT INTO transactions VALUES ({}, '{}', '{}', '{}', {}, {}, {}, {});""".format(new_date, row['Type'], row['Symbol'], row['Product Description'], units, gross_amount, trans_fee, net_amount)
-        # print(ex)
-        c.execute(ex)
-
-
-
-
-
-    conn.commit()
-
-    conn.close()
+def transactionsKey(conn):
+    # two fills can match on every column (two identical buys on the same day), so a transaction is identified by
+    # its columns plus Occurrence, which copy of that row it is. The first copy is 0, the second 1 and so on, so
+    # loading the same broker export twice doesn't add anything and a row that is in it twice is loaded twice.
+    # Tables from before Occurrence get the column and have their copies numbered in rowid order, nothing is deleted
+    columns = [column[1] for column in conn.execute("""PRAGMA table_info(transactions);""")]
+    if 'Occurrence' not in columns:
+        conn.execute("""DROP INDEX IF EXISTS `transactions_natural_key`;""")
+        conn.execute("""ALTER TABLE transactions ADD COLUMN `Occurrence` INT NOT NULL DEFAULT 0;""")
+        conn.execute("""UPDATE transactions SET Occurrence = numbered.n FROM (SELECT rowid AS id, ROW_NUMBER() OVER (
+                        PARTITION BY Trade_Date, Type, Symbol, Product_Description, Units, Gross_Amount, Transaction_Fee, Net_Amount
+                        ORDER BY rowid) - 1 AS n FROM transactions) AS numbered WHERE transactions.rowid = numbered.id;""")
+    conn.execute("""CREATE UNIQUE INDEX IF NOT EXISTS `transactions_occurrence_key` ON `transactions`
+                    (`Trade_Date`, `Type`, `Symbol`, `Product_Description`, `Units`, `Gross_Amount`, `Transaction_Fee`, `Net_Amount`, `Occurrence`);""")
+
+def withOccurrences(records, seen):
+    # numbers the copies of each row in the order they come in the file, seen carries the counts between chunks
+    numbered = []
+    for record in records:
+        occurrence = seen.get(record, 0)
+        seen[record] = occurrence + 1
+        numbered.append(record + (occurrence,))
+    return numbered
+
+def fillTransaction(transactionsFile=os.path.join(Path(__file__).parent.absolute(), "../General_Utility_Functions/Necessary_Info/Transactions_This_Year.csv"),
+                    chunksize=50000):
+    # reads the export chunksize rows at a time and writes them all in one transaction, skipping any transaction
+    # that is already in the table (see transactionsKey). Returns the number of new transactions
+    with transaction() as conn:
+        transactionsKey(conn)
+        before = conn.total_changes
+        seen = {}
+        for chunk in pd.read_csv(transactionsFile, usecols=TRANSACTION_COLUMNS, chunksize=chunksize):
+            chunk = chunk[TRANSACTION_COLUMNS].copy()
+            chunk['Trade Date'] = toTimestamps(chunk['Trade Date'])
+            chunk['Units'] = chunk['Units'].fillna(0).astype('int64')
+            chunk[['Gross Amount', 'Transaction Fee']] = chunk[['Gross Amount', 'Transaction Fee']].fillna(0.0)
+            # interest, deposits and the like have no symbol (and sometimes no description)
+            chunk[TEXT_COLUMNS] = chunk[TEXT_COLUMNS].fillna('')
+            # only a transaction that is already there is skipped, a row that breaks NOT NULL still raises
+            conn.executemany("""INSERT INTO transactions (Trade_Date, Type, Symbol, Product_Description, Units,
+                                Gross_Amount, Transaction_Fee, Net_Amount, Occurrence) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                                ON CONFLICT (Trade_Date, Type, Symbol, Product_Description, Units, Gross_Amount,
+                                Transaction_Fee, Net_Amount, Occurrence) DO NOTHING;""",
+                             withOccurrences(toRecords(chunk), seen))
+        return conn.total_changes - before
 
 # fillTransaction()
 
@@ -139,53 +137,41 @@ def fillTransaction():
 
 def selectTransactions():
 
-    conn = sqlite3.connect('database/Risk.db')
-
-    c = conn.cursor()
-
-    for row in c.execute("""SELECT rowid, * FROM transactions;"""):
-        print(row[0])
-
-    conn.close()
+    with connection() as conn:
+        for row in conn.execute("""SELECT rowid, * FROM transactions;"""):
+            print(row[0])
 
 # selectTransactions()
 
 def accounttable():
 
-    conn = sqlite3.connect('database/Risk.db')
-
-    c = conn.cursor()
-    c.execute("""CREATE TABLE `accounts` (
+    with transaction() as conn:
+        conn.execute("""CREATE TABLE `accounts` (
 	`username` VARCHAR(20) NOT NULL,
 	`password` VARCHAR(20) NOT NULL,
 	`analyst` BOOLEAN NOT NULL DEFAULT '1',
 	`senior_management` BOOLEAN NOT NULL DEFAULT '0',
 	`admin` BOOLEAN NOT NULL DEFAULT '0');""")
 
-    c.execute("""INSERT INTO accounts VALUES ('ssmif', 'quant2019', 1, 0, 0);""")
-
-    conn.commit()
-
-    conn.close()
+        conn.execute("""INSERT INTO accounts VALUES ('ssmif', 'quant2019', 1, 0, 0);""")
 
 # accounttable()
 
 
-def addStopLoss():
-    stopLossFile = os.path.join(Path(__file__).parent.absolute(), "../General_Utility_Functions/Necessary_Info/Stop_Losses.csv")
-    stopLosses = pd.read_csv(stopLossFile)
+def addStopLoss(stopLossFile=os.path.join(Path(__file__).parent.absolute(), "../General_Utility_Functions/Necessary_Info/Stop_Losses.csv")):
+    stopLosses = pd.read_csv(stopLossFile, usecols=['Ticker', 'Stop Loss Price']).dropna()
 
-    tickers = stopLosses['Ticker'].to_list()
-    losses = stopLosses['Stop Loss Price'].to_list()
+    with transaction() as conn:
+        conn.executemany("""UPDATE current_holdings SET Stop_Loss = ? WHERE Ticker = ?;""",
+                         toRecords(stopLosses[['Stop Loss Price', 'Ticker']]))
 
-    conn = sqlite3.connect('database/Risk.db')
-
-    c = conn.cursor()
-
-    for i in range(len(tickers)):
-        c.execute("""UPDATE current_holdings SET Stop_Loss = {} WHERE Ticker = '{}'""".format(losses[i], tickers[i]))
+# addStopLoss()
 
-    conn.commit()
 
-    conn.close()
-# addStopLoss()
+def nightlyLoad():
+    # reloads holdings, stop losses and new transactions from the broker files as one transaction, so the dashboard
+    # never sees holdings without their stop losses
+    with transaction():
+        fillHoldings()
+        addStopLoss()
+        return fillTransaction()
@@ -1,75 +1,40 @@
-import sqlite3
 import sys
 import os
 from pathlib import Path
 import pandas as pd
-import time
-import datetime
-import json
 sys.path.append(os.path.join(Path(__file__).parent.absolute().parent.absolute(), "General_Utility_Functions"))
 
-dbfile = os.path.join(Path(__file__).parent.absolute(), "database/Risk.db")
+from .connection import streamRows, jsonChunks
+from .csv_cache import csv_cache, toTimestamps
 
-def getHoldings():
-
-    conn = sqlite3.connect(dbfile)
-    c = conn.cursor()
+def iterHoldings(ticker=None):
+    if ticker is None:
+        return streamRows("""SELECT * FROM current_holdings;""")
+    return streamRows("""SELECT * FROM current_holdings WHERE Ticker = ?;""", (ticker.upper(),))
 
-    holdings = []
+def streamHoldings():
+    return jsonChunks(iterHoldings())
 
-    for row in c.execute("""SELECT * FROM current_holdings;"""):
-        holdings.append({'Ticker':row[0],
-                         'Company':row[1],
-                         'Sector':row[2],
-                         'Original_Purchase_Date':row[3],
-                         'Shares':row[4],
-                         'Entry_VWAP':row[5],
-                         'Invested_Amount':row[6],
-                         'Stop_Loss':row[7],
-                         'Current_Value_MTM':row[8],
-                         'Year_Open_Price':row[9],
-                         'Year_Open_Position_Value':row[10],
-                         'Month_Open_Price':row[11],
-                         'Month_Open_Position_Value':row[12]
-                         })
-
-    return holdings
+def getHoldings():
+    return list(iterHoldings())
 
 
 def getHoldingsByTicker(ticker):
+    return list(iterHoldings(ticker))
 
-    conn = sqlite3.connect(dbfile)
-    c = conn.cursor()
-
-    holdings = []
-    ticker = ticker.upper()
-
-    for row in c.execute("""SELECT * FROM current_holdings WHERE Ticker = '{}';""".format(ticker)):
-        holdings.append({'Ticker':row[0],
-                         'Company':row[1],
-                         'Sector':row[2],
-                         'Original_Purchase_Date':row[3],
-                         'Shares':row[4],
-                         'Entry_VWAP':row[5],
-                         'Invested_Amount':row[6],
-                         'Stop_Loss':row[7],
-                         'Current_Value_MTM':row[8],
-                         'Year_Open_Price':row[9],
-                         'Year_Open_Position_Value':row[10],
-                         'Month_Open_Price':row[11],
-                         'Month_Open_Position_Value':row[12]
-                         })
+holdingscsv = os.path.join(Path(__file__).parent.absolute().parent.absolute(), "General_Utility_Functions/Necessary_Info/Portfolio_Holdings.csv")
 
-    return holdings
-
-def getHoldingsFromCSV():
-    holdingscsv = os.path.join(Path(__file__).parent.absolute().parent.absolute(), "General_Utility_Functions/Necessary_Info/Portfolio_Holdings.csv")
-
-    holdings = pd.read_csv(holdingscsv)
-    pd.to_datetime(holdings['Original Purchase Date'])
-    holdings['Original Purchase Date'] = holdings['Original Purchase Date'].apply(lambda x: int(datetime.datetime.timestamp(datetime.datetime.strptime(x, "%m/%d/%Y"))))
+def parseHoldingsCSV(path):
+    holdings = pd.read_csv(path)
+    holdings['Original Purchase Date'] = toTimestamps(holdings['Original Purchase Date'])
     holdings.rename(columns={'Original Purchase Date':'Original_Purchase_Date', 'Entry VWAP':'Entry_VWAP', 'Invested Amount':'Invested_Amount',
                              'Current Value (Mark-to-Market)':'Current_Value_MTM', 'Year Open Price':'Year_Open_Price',
                              'Year Open Position Value':'Year_Open_Position_Value', 'Month Open Price':'Month_Open_Price', 'Month Open Position Value':'Month_Open_Position_Value'}, inplace=True)
+    return holdings
+
+def holdingsCSV():
+    # the cached (frame, JSON body, etag) of the holdings csv, only re-read after the file changes
+    return csv_cache.get(holdingscsv, parseHoldingsCSV)
 
-    return json.dumps(holdings.to_json(orient="records"))
+def getHoldingsFromCSV():
+    return holdingsCSV().body.decode()
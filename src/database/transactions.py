@@ -1,102 +1,134 @@
-import sqlite3
 import sys
 import os
 from pathlib import Path
 import pandas as pd
 import time
 import datetime
-import json
 
-dbfile = os.path.join(Path(__file__).parent.absolute(), "database/Risk.db")
+from .connection import connection, transaction, streamRows, jsonChunks
+from .csv_cache import csv_cache, toTimestamps
 
-def getTransactions():
-
-    conn = sqlite3.connect(dbfile)
-    c = conn.cursor()
+TRANSACTION_FIELDS = ['Trade_Date', 'Type', 'Symbol', 'Product_Description', 'Units', 'Gross_Amount', 'Transaction_Fee', 'Net_Amount']
 
-    transactions = []
+# the columns the API returns, Occurrence is only there to tell identical fills apart (see transactionsKey)
+FIELDS_SQL = ", ".join(TRANSACTION_FIELDS)
 
-    for row in c.execute("""SELECT * FROM transactions;"""):
-        transactions.append({
-                    'Trade_Date':row[0],
-                    'Type':row[1],
-                    'Symbol':row[2],
-                    'Product_Description':row[3],
-                    'Units':row[4],
-                    'Gross_Amount':row[5],
-                    'Transaction_Fee':row[6],
-                    'Net_Amount':row[7]
-                    })
-    return transactions
+def iterTransactions():
+    return streamRows("""SELECT {} FROM transactions;""".format(FIELDS_SQL))
 
-def getTransactionsAfterDate(time):
+def streamTransactions():
+    return jsonChunks(iterTransactions())
 
-    conn = sqlite3.connect(dbfile)
-    c = conn.cursor()
+def getTransactions():
+    return list(iterTransactions())
 
-    transactions = []
+def getTransactionsAfterDate(time):
 
-    for row in c.execute("""SELECT * FROM transactions WHERE Trade_Date > {};""".format(time)):
-        transactions.append({
-                    'Trade_Date':row[0],
-                    'Type':row[1],
-                    'Symbol':row[2],
-                    'Product_Description':row[3],
-                    'Units':row[4],
-                    'Gross_Amount':row[5],
-                    'Transaction_Fee':row[6],
-                    'Net_Amount':row[7]
-                    })
-    return transactions
+    ensureIndexes()
+    return list(streamRows("""SELECT {} FROM transactions WHERE Trade_Date > ?;""".format(FIELDS_SQL), (time,)))
 
 
 def getTransactionsBeforeDate(time):
 
-    conn = sqlite3.connect(dbfile)
-    c = conn.cursor()
-
-    transactions = []
-
-    for row in c.execute("""SELECT * FROM transactions WHERE Trade_Date < {};""".format(time)):
-        transactions.append({
-                    'Trade_Date':row[0],
-                    'Type':row[1],
-                    'Symbol':row[2],
-                    'Product_Description':row[3],
-                    'Units':row[4],
-                    'Gross_Amount':row[5],
-                    'Transaction_Fee':row[6],
-                    'Net_Amount':row[7]
-                    })
-    return transactions
-
-def getTransactionsFromCSV():
-    transactionscsv = os.path.join(Path(__file__).parent.absolute().parent.absolute(), "General_Utility_Functions/Necessary_Info/Transactions.csv")
-
-    trans = pd.read_csv(transactionscsv)
-    pd.to_datetime(trans['Trade Date'])
-    trans['Trade Date'] = trans['Trade Date'].apply(lambda x: int(datetime.datetime.timestamp(datetime.datetime.strptime(x, "%m/%d/%Y"))))
+    ensureIndexes()
+    return list(streamRows("""SELECT {} FROM transactions WHERE Trade_Date < ?;""".format(FIELDS_SQL), (time,)))
+
+MAX_PAGE = 5000
+
+indexed = False
+
+def transactionsIndexes(conn):
+    # Trade_Date for date ranges, (Symbol, Trade_Date) and (Type, Trade_Date) so a per-symbol or per-type lookup reads
+    # just that symbol's rows, already in date order
+    conn.execute("""CREATE INDEX IF NOT EXISTS `transactions_trade_date` ON `transactions` (`Trade_Date`);""")
+    conn.execute("""CREATE INDEX IF NOT EXISTS `transactions_symbol_date` ON `transactions` (`Symbol`, `Trade_Date`);""")
+    conn.execute("""CREATE INDEX IF NOT EXISTS `transactions_type_date` ON `transactions` (`Type`, `Trade_Date`);""")
+
+def ensureIndexes():
+    global indexed
+    if not indexed:
+        with transaction() as conn:
+            transactionsIndexes(conn)
+        indexed = True
+
+def queryTransactions(start=None, end=None, symbol=None, trade_type=None, limit=500, cursor=None):
+    # transactions between the start and end timestamps (both included), optionally for one symbol and/or type, in
+    # date order. Returns at most limit transactions and a cursor for the next page (None on the last page). Pages
+    # continue from the (Trade_Date, rowid) of the last row instead of using OFFSET, so a deep page costs the same
+    # as the first. limit is clamped to 1 to MAX_PAGE, a cursor that isn't one this function returned raises
+    # ValueError
+    ensureIndexes()
+    limit = min(max(int(limit), 1), MAX_PAGE)
+
+    where, params = [], []
+    if start is not None:
+        where.append("Trade_Date >= ?")
+        params.append(start)
+    if end is not None:
+        where.append("Trade_Date <= ?")
+        params.append(end)
+    if symbol is not None:
+        where.append("Symbol = ?")
+        params.append(symbol.upper())
+    if trade_type is not None:
+        where.append("Type = ?")
+        params.append(trade_type)
+    if cursor is not None:
+        try:
+            last_date, last_rowid = cursor.split('_')
+            last_date, last_rowid = float(last_date), int(last_rowid)
+        except ValueError:
+            raise ValueError('bad cursor {!r}'.format(cursor))
+        where.append("(Trade_Date, rowid) > (?, ?)")
+        params.extend([last_date, last_rowid])
+
+    sql = """SELECT rowid, {} FROM transactions {} ORDER BY Trade_Date, rowid LIMIT ?;""".format(
+        FIELDS_SQL, "WHERE " + " AND ".join(where) if where else "")
+    with connection() as conn:
+        rows = conn.execute(sql, params + [limit + 1]).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = "{}_{}".format(rows[-1][1], rows[-1][0])
+    return [dict(zip(TRANSACTION_FIELDS, row[1:])) for row in rows], next_cursor
+
+transactionscsv = os.path.join(Path(__file__).parent.absolute().parent.absolute(), "General_Utility_Functions/Necessary_Info/Transactions.csv")
+
+def parseTransactionsCSV(path):
+    trans = pd.read_csv(path)
+    trans['Trade Date'] = toTimestamps(trans['Trade Date'])
     trans.rename(columns={"Trade Date":"Trade_Date", 'Product Description':'Product_Description', 'Gross Amount':'Gross_Amount',
                           'Transaction Fee':'Transaction_Fee', 'Net Amount':'Net_Amount'}, inplace=True)
+    return trans
 
-    return json.dumps(trans.to_json(orient="records"))
+def transactionsCSV():
+    # the cached (frame, JSON body, etag) of the transactions csv, only re-read after the file changes
+    return csv_cache.get(transactionscsv, parseTransactionsCSV)
 
+def getTransactionsFromCSV():
+    return transactionsCSV().body.decode()
 
-def newTransaction(trade_date, trade_type, symbol, product_description, units, gross_amount, trans_fee, net_amount):
 
-    conn = sqlite3.connect(dbfile)
-    c = conn.cursor()
+def newTransaction(trade_date, trade_type, symbol, product_description, units, gross_amount, trans_fee, net_amount, new_fill=False):
 
     dates = trade_date.split('-')
     d = datetime.datetime(year = int(dates[0]), month = int(dates[1]), day = int(dates[2]))
-
-    ex = """INSERT INTO transactions VALUES ({}, '{}', '{}', '{}', {}, {}, {}, {});""".format(datetime.datetime.timestamp(d), trade_type, symbol, product_description, units, gross_amount, trans_fee, net_amount)
-
-    c.execute(ex)
-
-    conn.commit()
-
-    conn.close()
+    values = (datetime.datetime.timestamp(d), trade_type, symbol, product_description, units, gross_amount, trans_fee, net_amount)
+
+    # returns False without adding anything if the same transaction is already in the table, e.g. it was loaded
+    # from the broker export. With new_fill it is added anyway as another fill identical to the ones there, under the
+    # next free Occurrence (see transactionsKey)
+    with transaction() as conn:
+        if new_fill:
+            cursor = conn.execute("""INSERT INTO transactions (Trade_Date, Type, Symbol, Product_Description, Units, Gross_Amount,
+                                     Transaction_Fee, Net_Amount, Occurrence) SELECT ?, ?, ?, ?, ?, ?, ?, ?, COALESCE(MAX(Occurrence) + 1, 0)
+                                     FROM transactions WHERE Trade_Date = ? AND Type = ? AND Symbol = ? AND Product_Description = ?
+                                     AND Units = ? AND Gross_Amount = ? AND Transaction_Fee = ? AND Net_Amount = ?;""", values + values)
+        else:
+            cursor = conn.execute("""INSERT INTO transactions (Trade_Date, Type, Symbol, Product_Description, Units, Gross_Amount,
+                                     Transaction_Fee, Net_Amount) VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT DO NOTHING;""", values)
+        return cursor.rowcount == 1
 
 # newTransaction(1546405200, 'Dividend', 'WMT', 'Walmart Inc', 0, 49.92, 0, 49.92)
 
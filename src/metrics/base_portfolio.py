@@ -0,0 +1,138 @@
+# -----------------------------------------------------------
+# our current book worked out once a day, so "what if we added X at weight w" is a cheap update rather than a rebuild
+#
+# Stevens Institute of Technology, Hoboken, New Jersey
+# Stevens Student Managed Investment Fund
+# -----------------------------------------------------------
+
+import threading
+import numpy as np
+import pandas as pd
+from math import sqrt
+from collections import OrderedDict
+from src.metrics.ssmif_datareader import DataReader
+from src.metrics.portfolio import Portfolio
+from src.metrics.screen_cache import price_day, files_version
+
+# position sizes the VaR-vs-size curve is drawn at unless others are asked for, 0 to 10% of the book
+CURVE_SIZES = np.round(np.arange(0, 0.1001, 0.005), 4)
+
+
+def tail_risk(returns, confidence_level=0.05) -> tuple:
+    """Monthly VaR and CVaR of daily returns as positive losses, the quantile and the mean of the worst
+    confidence_level of days, scaled by sqrt(21) like risk_metrics.VaR. Given a (days x columns) array, returns a
+    (VaR, CVaR) array for each column"""
+    returns = np.sort(np.asarray(returns, dtype=float), axis=0)
+    var = -np.quantile(returns, confidence_level, axis=0) * sqrt(252 / 12)
+    cvar = -returns[:max(1, int(len(returns) * confidence_level))].mean(axis=0) * sqrt(252 / 12)
+    return var, cvar
+
+
+class BasePortfolio:
+    """Our book held at today's weights (without cash) over a lookback: the daily returns of every position, the
+    weights, their covariance and the returns of the book as a whole.
+
+    Adding a candidate at weight w scales everything held by (1 - w), so the new book's daily returns are
+    (1 - w) * book + w * candidate and its variance is (1 - w)^2 w'Cw + 2 w (1 - w) cov(book, candidate) + w^2
+    var(candidate). Both only need the candidate's returns and the book's, never the positions again, so one
+    candidate at one size is a single pass over the days however many positions we hold."""
+
+    def __init__(self, returns: pd.DataFrame, weights: pd.Series):
+        # a stock that hasn't listed yet (or a missing day) counts as flat rather than dropping the whole day
+        self.returns = returns.fillna(0.0)
+        self.weights = weights.reindex(self.returns.columns)
+        self.covariance = self.returns.cov()
+        self.book = pd.Series(self.returns.to_numpy() @ self.weights.to_numpy(), index=self.returns.index)
+        self.variance = float(self.weights @ self.covariance @ self.weights) if len(self.weights) else 0.0
+        self.mean_weight = self.weights.mean() if len(self.weights) else 1.0
+
+    @classmethod
+    def load(cls, start, end):
+        """Our current weights from Portfolio and the prices of everything in the book between start and end"""
+        weights = Portfolio(start, end).weights().iloc[-1]
+        weights = weights[(weights != 0) & (weights.index != 'CASH')]
+        if not len(weights):
+            return cls(pd.DataFrame(index=pd.DatetimeIndex([], name='Date')), weights)
+        returns = DataReader(list(weights.index), start=start, end=end)['Adj Close'].pct_change().iloc[1:]
+        return cls(returns, weights)
+
+    def __aligned(self, returns) -> tuple:
+        returns = returns.to_frame() if isinstance(returns, pd.Series) else returns
+        index = returns.index if self.book.empty else self.book.index
+        return self.book.reindex(index).fillna(0.0).to_numpy(), returns.reindex(index).fillna(0.0), index
+
+    def with_position(self, returns, weight=None) -> pd.DataFrame:
+        """The book's daily returns with each column of returns (daily returns of a candidate) added at weight, the
+        average weight of our positions if not given"""
+        book, returns, index = self.__aligned(returns)
+        weight = self.mean_weight if weight is None else weight
+        return pd.DataFrame((1 - weight) * book[:, None] + weight * returns.to_numpy(), index=index,
+                            columns=returns.columns)
+
+    def what_if(self, returns, weight=None, confidence_level=0.05) -> pd.DataFrame:
+        """Monthly VaR, CVaR (see tail_risk) and volatility of the book with each column of returns added at weight,
+        a row per candidate"""
+        var, cvar = tail_risk(self.with_position(returns, weight).to_numpy(), confidence_level)
+        book, candidates, _ = self.__aligned(returns)
+        weight = self.mean_weight if weight is None else weight
+        variance = self.__variance(book, candidates.to_numpy(), weight)
+        return pd.DataFrame({'VaR': var, 'CVaR': cvar, 'volatility': np.sqrt(variance) * sqrt(252 / 12)},
+                            index=candidates.columns)
+
+    def size_curve(self, returns: pd.Series, sizes=CURVE_SIZES, confidence_level=0.05) -> pd.DataFrame:
+        """Monthly VaR, CVaR and volatility of the book with one candidate added at each of sizes, a row per size.
+        Every size is one column of a (days x sizes) array, so the whole curve is one sort"""
+        book, candidate, _ = self.__aligned(returns)
+        candidate = candidate.to_numpy()[:, 0]
+        sizes = np.asarray(sizes, dtype=float)
+        var, cvar = tail_risk(np.outer(book, 1 - sizes) + np.outer(candidate, sizes), confidence_level)
+        variance = self.__variance(book, candidate[:, None], sizes[None, :])[0]
+        return pd.DataFrame({'VaR': var, 'CVaR': cvar, 'volatility': np.sqrt(variance) * sqrt(252 / 12)},
+                            index=pd.Index(sizes, name='weight'))
+
+    def __variance(self, book, candidates, weight):
+        # the days can be different from the ones the covariance was worked out on (no positions, or a candidate
+        # with days the book doesn't have), so the book's variance comes from w'Cw only when they line up
+        days = len(book)
+        book_variance = self.variance if days == len(self.book) else np.var(book, ddof=1)
+        centered = candidates - candidates.mean(axis=0)
+        covariance = centered.T @ (book - book.mean()) / max(days - 1, 1)
+        variance = (centered ** 2).sum(axis=0) / max(days - 1, 1)
+        return (1 - weight) ** 2 * book_variance + 2 * weight * (1 - weight) * covariance + weight ** 2 * variance
+
+
+_states = OrderedDict()  # (start, price day) -> (version, BasePortfolio)
+_building = {}  # (start, price day) -> lock held while that one is built
+_lock = threading.Lock()  # only ever held for dict lookups, never while building
+
+
+def base_portfolio(start, end, max_states=16, version=files_version) -> BasePortfolio:
+    """The BasePortfolio from start to end, built the first time it is asked for after a close and reused until the
+    next one, or until our positions change (see screen_cache.price_day and files_version). Screens that ask for the
+    same one together wait for a single build, ones with another lookback or day don't wait at all"""
+    key, current = (start, price_day(end)), version()
+    with _lock:
+        building = _building.setdefault(key, threading.Lock())
+    with building:
+        with _lock:
+            state = _states.get(key)
+            if state is not None and state[0] == current:
+                _states.move_to_end(key)
+                return state[1]
+        state = (current, BasePortfolio.load(start, end))
+        with _lock:
+            _states[key] = state
+            _states.move_to_end(key)
+            while len(_states) > max_states:
+                _building.pop(_states.popitem(last=False)[0], None)
+        return state[1]
+
+
+def clear():
+    """Forgets every base portfolio, e.g. after the positions csv is corrected by hand"""
+    with _lock:
+        _states.clear()
+
+
+if __name__ == '__main__':
+    pass
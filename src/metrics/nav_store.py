@@ -0,0 +1,153 @@
+# -----------------------------------------------------------
+# materialized daily position values, NAV and weights so Portfolio objects open instantly
+#
+# Stevens Institute of Technology, Hoboken, New Jersey
+# Stevens Student Managed Investment Fund
+# -----------------------------------------------------------
+
+import os
+import json
+import datetime
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from src.metrics.ssmif_datareader import DataReader
+
+POSITIONS_CSV = 'General_Utility_Functions/Necessary_Info/Portfolio_Positions.csv'
+
+STORE_DIR = os.environ.get('SSMIF_NAV_STORE', os.path.join(Path(__file__).parent.absolute(), 'nav_data'))
+
+MARKET_CLOSE = datetime.time(16, 0)
+
+
+def read_positions(positions_csv=POSITIONS_CSV) -> pd.DataFrame:
+    """Reads the Portfolio_Positions csv, the number of shares (and cash) we held on each date"""
+    positions = pd.read_csv(positions_csv, index_col='Unnamed: 0')
+    positions.index = pd.to_datetime(positions.index, format='%Y-%m-%d')
+    return positions.fillna(0).sort_index()
+
+
+def last_close(now=None) -> pd.Timestamp:
+    """The most recent time the market could have closed: today at MARKET_CLOSE once that has passed on a business
+    day, otherwise the business day before. BDay doesn't know about holidays, so on one this is later than the real
+    close, which only costs one extra refresh"""
+    now = pd.Timestamp(datetime.datetime.now() if now is None else now)
+    day = pd.offsets.BDay().rollback(now.normalize())
+    close = day + pd.Timedelta(hours=MARKET_CLOSE.hour, minutes=MARKET_CLOSE.minute)
+    if close > now:
+        close = day - pd.offsets.BDay() + pd.Timedelta(hours=MARKET_CLOSE.hour, minutes=MARKET_CLOSE.minute)
+    return close
+
+
+def _fingerprint(positions: pd.DataFrame) -> str:
+    return '{:x}'.format(int(pd.util.hash_pandas_object(positions, index=True).sum()) & (2 ** 64 - 1))
+
+
+class NAVStore:
+    """Keeps the value of every position, the NAV and the weights for every business day on disk. refresh only
+    computes the days after the last stored one (and redoes the last one, since it may have been stored intraday),
+    unless the positions csv changed for days that are already stored, then everything is rebuilt. Everything,
+    including its meta data, is one .npz file replaced with a single rename, so another process reading it never gets
+    the new dates with the old values."""
+
+    def __init__(self, directory=STORE_DIR):
+        self.directory = directory
+        self.__lock = threading.Lock()
+
+    def _path(self) -> str:
+        return os.path.join(self.directory, 'nav.npz')
+
+    def meta(self) -> dict:
+        try:
+            with np.load(self._path()) as stored:
+                return json.loads(str(stored['meta']))
+        except FileNotFoundError:
+            return {}
+
+    def covers(self, start, end) -> bool:
+        """True when the store already has every business day between start and end, or has nothing more to get
+        for them: it was refreshed through end after the last close, so a market holiday or a trading day before its
+        close (when the last stored day is earlier than the last business day) doesn't rebuild it every time"""
+        meta = self.meta()
+        if not meta or meta['positions_mtime'] != os.path.getmtime(meta['positions_csv']):
+            return False
+        if pd.Timestamp(meta['start']) > pd.Timestamp(start):
+            return False
+        wanted = min(pd.Timestamp(end), pd.Timestamp(datetime.date.today()))
+        if pd.Timestamp(meta['end']) >= pd.offsets.BDay().rollback(wanted):
+            return True
+        return ('refreshed' in meta and pd.Timestamp(meta['refreshed_through']) >= wanted
+                and pd.Timestamp(meta['refreshed']) >= last_close())
+
+    def refresh(self, start='2019-01-01', end=None, positions_csv=POSITIONS_CSV):
+        """Brings the store up to date through end (today if not given)"""
+        with self.__lock:
+            positions = read_positions(positions_csv)
+            meta = self.meta()
+            refreshed = datetime.datetime.now()
+            start = pd.Timestamp(start)
+            end = pd.Timestamp(datetime.date.today() if end is None else end)
+
+            rebuild = (not meta or pd.Timestamp(meta['start']) > start or meta['columns'] != list(positions.columns)
+                       or meta['fingerprint'] != _fingerprint(positions[:meta['end']]))
+            if rebuild:
+                old = None
+                fetch_start = start
+            else:
+                old = self.load()
+                old = tuple(frame[:pd.Timestamp(meta['end']) - pd.Timedelta(days=1)] for frame in old)
+                fetch_start = pd.Timestamp(meta['end'])
+                start = pd.Timestamp(meta['start'])
+            if fetch_start > end:
+                return
+
+            # a day a stock didn't trade keeps its last close
+            prices = DataReader(list(positions.columns[1:]), start=fetch_start, end=end)['Close'].ffill()
+            held = positions.reindex(positions.index.union(prices.index)).ffill().bfill().reindex(prices.index)
+            cash, shares = held['CASH'], held.drop('CASH', axis=1)
+            # DataReader gives a ticker it couldn't pull as NaNs, which the NAV would count as 0. Nothing is written
+            # then, so the next refresh tries those days again instead of keeping an understated NAV for good
+            unpriced = (shares != 0) & prices.isna()
+            if unpriced.any().any():
+                raise ValueError('no prices for {} on days we held them, the NAV store was not updated'.format(
+                    ', '.join(unpriced.columns[unpriced.any()])))
+            values = pd.concat([cash, (shares * prices).where(shares != 0, 0.0)], axis=1, sort=False)
+            nav = values.sum(axis='columns')
+            weights = values.divide(nav, axis=0)
+            if old is not None:
+                values = pd.concat([old[0], values])
+                nav = pd.concat([old[1], nav])
+                weights = pd.concat([old[2], weights])
+
+            last = values.index[-1] if len(values) else start
+            meta = {'start': str(start.date()), 'end': str(last.date()), 'columns': list(positions.columns),
+                    'fingerprint': _fingerprint(positions[:last]), 'positions_csv': os.path.abspath(positions_csv),
+                    'positions_mtime': os.path.getmtime(positions_csv), 'refreshed': refreshed.isoformat(),
+                    'refreshed_through': str(end.date())}
+            os.makedirs(self.directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False) as f:
+                np.savez(f, dates=values.index.values.astype('datetime64[D]'), values=values.to_numpy(dtype=float),
+                         nav=nav.to_numpy(dtype=float), weights=weights.to_numpy(dtype=float),
+                         meta=np.array(json.dumps(meta)))
+            os.replace(f.name, self._path())
+
+    def load(self, start=None, end=None):
+        """Returns the position values, NAV and weights between start and end (inclusive)"""
+        with np.load(self._path()) as stored:
+            meta, dates = json.loads(str(stored['meta'])), stored['dates']
+            lo = 0 if start is None else np.searchsorted(dates, np.datetime64(pd.Timestamp(start).date(), 'D'), 'left')
+            hi = len(dates) if end is None else np.searchsorted(dates, np.datetime64(pd.Timestamp(end).date(), 'D'),
+                                                                'right')
+            index = pd.DatetimeIndex(np.array(dates[lo:hi], dtype='datetime64[ns]'), name='Date')
+            values = pd.DataFrame(stored['values'][lo:hi], index=index, columns=meta['columns'])
+            nav = pd.Series(stored['nav'][lo:hi], index=index)
+            weights = pd.DataFrame(stored['weights'][lo:hi], index=index, columns=meta['columns'])
+        return values, nav, weights
+
+nav_store = NAVStore()
+
+
+if __name__ == '__main__':
+    pass
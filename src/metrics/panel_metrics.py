@@ -0,0 +1,125 @@
+# -----------------------------------------------------------
+# the risk_metrics functions computed for every column of a (dates x tickers) price panel at once
+#
+# Stevens Institute of Technology, Hoboken, New Jersey
+# Stevens Student Managed Investment Fund
+# -----------------------------------------------------------
+
+import numpy as np
+import pandas as pd
+from math import sqrt
+
+
+def _as_frame(price_data) -> pd.DataFrame:
+    if isinstance(price_data, pd.DataFrame):
+        return price_data.astype(float)
+    if isinstance(price_data, pd.Series):
+        return price_data.to_frame().astype(float)
+    return pd.DataFrame(np.asarray(price_data, dtype=float))
+
+
+def _returns(prices: pd.DataFrame) -> np.ndarray:
+    """Daily returns of every column, a NaN wherever either of the two prices is missing"""
+    values = prices.to_numpy()
+    return values[1:] / values[:-1] - 1
+
+
+def monthly_vol(price_data) -> pd.Series:
+    """Returns the volatility you can expect over a month for every column"""
+    prices = _as_frame(price_data)
+    return pd.Series(np.nanstd(_returns(prices), axis=0, ddof=1) * sqrt(252 / 12), index=prices.columns)
+
+
+def semi_deviation(price_data) -> pd.Series:
+    """Returns the semi-deviation of every column, see risk_metrics.semi_deviation"""
+    prices = _as_frame(price_data)
+    returns = _returns(prices)
+    below = returns < np.nanmean(returns, axis=0)  # NaNs compare as False so they drop out here
+    count = below.sum(axis=0)
+    downside = np.where(below, returns, 0.0)
+    mean = downside.sum(axis=0) / np.maximum(count, 1)
+    var = (np.where(below, returns - mean, 0.0) ** 2).sum(axis=0) / (count - 1)
+    return pd.Series(np.sqrt(np.where(count > 1, var, np.nan)), index=prices.columns)
+
+
+def beta(price_data, benchmark_data) -> pd.Series:
+    """Returns the beta of every column against the benchmark, see risk_metrics.beta. Computed in closed form as
+    cov(stock, benchmark) / var(benchmark) over the days both have a return, which is the same slope the linear
+    regression finds."""
+    prices = _as_frame(price_data)
+    if isinstance(benchmark_data, (pd.Series, pd.DataFrame)) and isinstance(price_data, (pd.Series, pd.DataFrame)):
+        benchmark = _as_frame(benchmark_data).iloc[:, 0].reindex(prices.index).to_numpy()
+    else:
+        benchmark = np.asarray(benchmark_data, dtype=float).reshape(-1)
+    returns = _returns(prices)
+    bench_returns = (benchmark[1:] / benchmark[:-1] - 1)[:, None]
+
+    both = ~np.isnan(returns) & ~np.isnan(bench_returns)
+    count = both.sum(axis=0)
+    r = np.where(both, returns, 0.0)
+    b = np.where(both, bench_returns, 0.0)
+    sum_r, sum_b = r.sum(axis=0), b.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = (r * b).sum(axis=0) - sum_r * sum_b / count
+        var = (b * b).sum(axis=0) - sum_b ** 2 / count
+        betas = np.where(count > 1, cov / var, np.nan)
+    return pd.Series(betas, index=prices.columns)
+
+
+def VaR(price_data, confidence_level=0.05) -> pd.Series:
+    """Returns the value-at-risk of every column, see risk_metrics.VaR"""
+    prices = _as_frame(price_data)
+    return pd.Series(np.nanquantile(_returns(prices), confidence_level, axis=0) * sqrt(252 / 12), index=prices.columns)
+
+
+def CVaR(price_data, confidence_level=0.05) -> pd.Series:
+    """Returns the conditional value-at-risk of every column, see risk_metrics.CVaR. Every column is sorted in one
+    call and the mean of the worst returns is read off a cumulative sum."""
+    prices = _as_frame(price_data)
+    returns = np.sort(_returns(prices), axis=0)  # NaNs get sorted to the bottom
+    tail = (np.sum(~np.isnan(returns), axis=0) * confidence_level).astype(int)
+    if len(returns) == 0:
+        return pd.Series(np.nan, index=prices.columns)
+    cumulative = np.nancumsum(returns, axis=0)
+    tail_sum = np.take_along_axis(cumulative, np.maximum(tail - 1, 0)[None, :], axis=0)[0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cvar = np.where(tail > 0, (1 - tail_sum / tail) * sqrt(252 / 12), np.nan)
+    return pd.Series(cvar, index=prices.columns)
+
+
+def maximum_drawdown(price_data, window=252) -> pd.Series:
+    """Returns the maximum drawdown of every column, see risk_metrics.maximum_drawdown. Only the last
+    2 * window - 1 days can change the last value, so only those are looked at."""
+    prices = _as_frame(price_data).iloc[-(2 * window - 1):]
+    drawdown = prices / prices.rolling(window=window, min_periods=1).max() - 1.0
+    return drawdown.iloc[-window:].min()
+
+
+def pain_index(price_data, window=252) -> pd.Series:
+    """Returns the pain index of every column, see risk_metrics.pain_index. Days without a price (like before a
+    stock listed) are left out of the mean."""
+    prices = _as_frame(price_data)
+    rolling_max = prices.rolling(window, min_periods=1).max()
+    return ((prices - rolling_max) / rolling_max).abs().mean()
+
+
+def risk_panel(price_data, benchmark_data=None, confidence_level=0.05, window=252) -> pd.DataFrame:
+    """Returns a DataFrame with a row for every column of price_data (e.g. every ticker in a universe) and a column
+    for each of the risk_metrics measures. Beta is only included when benchmark_data is given."""
+    prices = _as_frame(price_data)
+    metrics = {
+        'monthly_vol': monthly_vol(prices),
+        'semi_deviation': semi_deviation(prices),
+        'VaR': VaR(prices, confidence_level=confidence_level),
+        'CVaR': CVaR(prices, confidence_level=confidence_level),
+        'maximum_drawdown': maximum_drawdown(prices, window=window),
+        'pain_index': pain_index(prices, window=window),
+    }
+    if benchmark_data is not None:
+        metrics['beta'] = beta(price_data if isinstance(price_data, (pd.Series, pd.DataFrame)) else prices,
+                               benchmark_data)
+    return pd.DataFrame(metrics)
+
+
+if __name__ == '__main__':
+    pass
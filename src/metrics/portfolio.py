@@ -9,8 +9,14 @@ import datetime
 import pandas as pd
 from pandas.tseries.offsets import BDay
 from math import sqrt
-from src.metrics.risk_metrics import semi_deviation, beta, VaR, CVaR, maximum_drawdown, pain_index
+from src.metrics.risk_metrics import semi_deviation, beta, VaR, CVaR, maximum_drawdown, pain_index, stop_loss_levels
 from src.metrics.ssmif_datareader import DataReader
+from src.metrics.nav_store import nav_store
+from src.risk.risk_decomposition import covariance_model, risk_contributions, VaR_contributions
+from src.risk.monte_carlo import monte_carlo_VaR
+from src.risk.garch import fit_universe
+from src.risk.stress_test import historical_scenarios, stress_test
+from src.risk.var_backtest import backtest_VaR
 
 
 def last_business_day(date):
@@ -27,46 +33,38 @@ class Portfolio:
         self.__NAV = None
         self.__weights = None
         self.__benchmark = None
-        self.__marginal_risk_holdings = None
+        self.__risk_decompositions = {}
+
+    def __load(self):
+        """Loads our positions, NAV and weights between start and end from the materialized nav store, bringing the
+        store up to date first if it doesn't have those days yet"""
+        if not nav_store.covers(self.start, self.end):
+            nav_store.refresh(start=self.start, end=self.end)
+        self.__holdings, self.__NAV, self.__weights = nav_store.load(self.start, self.end)
+        self.__weights.name = 'position weights'
 
     def holdings(self) -> pd.DataFrame: #or positions
         """Calls the Portfolio_Holdings csv under Necessary_Info to arrive at a df of our positions for every
         business day between start and end date"""
         if self.__holdings is None:
-            # calls the csv and stock prices for each day and reindexes the csv dataframe with datetime instead of strings
-            port_holdings = pd.read_csv('General_Utility_Functions/Necessary_Info/Portfolio_Positions.csv',
-                                        index_col='Unnamed: 0')
-            port_holdings = port_holdings.fillna(0)
-            holding_prices = DataReader(port_holdings.columns[1:], self.start, self.end)['Close']
-            port_holdings.index = port_holdings.index.map(lambda x: datetime.datetime.strptime(x, '%Y-%m-%d').date())
-            port_holdings = port_holdings.reindex(holding_prices.index)
-            port_holdings = port_holdings.fillna(method='ffill')
-            port_holdings = port_holdings.fillna(method='bfill')
-            # removes cash from port_holdings to make calcuation of stock positions easier
-            cash = port_holdings['CASH']
-            port_holdings = port_holdings.drop('CASH', axis=1)
-            # calculates our stock positions and adds cash back in
-            port_holdings = port_holdings * holding_prices
-            port_holdings = pd.concat([cash, port_holdings], axis=1, sort=False)
-            self.__holdings = port_holdings
+            self.__load()
         return self.__holdings
 
     def current_holdings(self) -> pd.Series:
         """Returns the companies we currently own"""
-        return self.holdings()[-1]
+        holdings = self.holdings().iloc[-1]
+        return holdings[(holdings != 0) & (holdings.index != 'CASH')]
 
     def NAV(self) -> pd.Series:
         """Returns a pandas time series of our Net Asset Value for each day"""
         if self.__NAV is None:
-            self.__NAV = self.holdings().sum(axis='columns')  # add along columns, so you'll get the sum for each row
+            self.__load()
         return self.__NAV
 
     def weights(self) -> pd.DataFrame:
         """Returns a df our portfolio weights for each day for each stock thats held over the entire period"""
         if self.__weights is None:
-            position_weights = self.holdings().divide(self.NAV(), axis=0)
-            position_weights.name = 'position weights'
-            self.__weights = position_weights
+            self.__load()
         return self.__weights
 
     def benchmark(self, benchmark='^GSPC') -> pd.Series:
@@ -184,12 +182,61 @@ class Portfolio:
         """The pain index that our NAV had over the given window"""
         return pain_index(self.NAV(), window=window)
 
+    def stop_losses(self, start, end=datetime.datetime.today().date(), window=14, multiplier=2.0,
+                    smoothing='wilder') -> pd.Series:
+        """The stop-loss price for every company we currently own, from each stock's ATR over the period"""
+        prices = DataReader(self.current_holdings().index, start=start, end=end)
+        return stop_loss_levels(prices['High'], prices['Low'], prices['Close'], window=window, multiplier=multiplier,
+                                smoothing=smoothing)
+
+    def risk_decomposition(self, start, end=datetime.datetime.today().date(), halflife=None, shrinkage=None,
+                           confidence_level=0.05) -> pd.DataFrame:
+        """Breaks our volatility and VaR under our current holdings down by stock: the weight, marginal, component
+        and percent contribution to daily volatility and the marginal and component contribution to VaR. halflife
+        (in days) weights recent returns more and shrinkage='ledoit-wolf' shrinks the covariance matrix"""
+        key = (pd.Timestamp(start), pd.Timestamp(end), halflife, shrinkage, confidence_level)
+        if key not in self.__risk_decompositions:
+            weights = self.weights().iloc[-1][self.current_holdings().index]
+            cov = covariance_model(weights.index, start, end, halflife=halflife, shrinkage=shrinkage).covariance
+            vol = risk_contributions(cov, weights)
+            var = VaR_contributions(cov, weights, confidence_level=confidence_level)
+            self.__risk_decompositions[key] = vol.join(var[['marginal', 'component']], rsuffix='_VaR')
+        return self.__risk_decompositions[key]
+
+    def monte_carlo_VaR(self, start, end=datetime.datetime.today().date(), confidence_level=0.05, **kwargs) -> dict:
+        """Our monte carlo VaR and CVaR under our current holdings, simulated from the covariance of our stocks'
+        daily returns over the period. Takes the same keyword arguments as monte_carlo.monte_carlo_VaR"""
+        weights = self.weights().iloc[-1][self.current_holdings().index]
+        model = covariance_model(weights.index, start, end)
+        return monte_carlo_VaR(weights, model.covariance, mean=model.mean, confidence_level=confidence_level,
+                               **kwargs)
+
+    def garch_VaR(self, start, end=datetime.datetime.today().date(), confidence_level=0.05,
+                  n_workers=None) -> pd.DataFrame:
+        """GARCH(1,1) fits and one day filtered historical simulation VaR and CVaR for every stock we currently own
+        and for our NAV (the 'NAV' row). Fits are warm started from the last run"""
+        returns = DataReader(self.current_holdings().index, start=start, end=end)['Adj Close'].pct_change().iloc[1:]
+        returns['NAV'] = self.NAV()[pd.Timestamp(start):pd.Timestamp(end)].pct_change()
+        return fit_universe(returns, confidence_level=confidence_level, n_workers=n_workers)
+
+    def stress_test(self, scenarios=None) -> pd.DataFrame:
+        """Replays past crises (or the given ScenarioSet) against our current holdings and returns the P&L, return and
+        worst drawdown of the book for each one"""
+        holdings = self.holdings().iloc[-1]
+        if scenarios is None:
+            scenarios = historical_scenarios(self.current_holdings().index)
+        return stress_test(holdings, scenarios)
+
+    def backtest_VaR(self, window=252, estimators=('historical', 'parametric', 'ewma'), confidence_levels=(0.01, 0.05),
+                     n_workers=None) -> pd.DataFrame:
+        """Rolls one day VaR / CVaR estimators over our NAV history and tests how often, and how clustered, the
+        breaches were against what each confidence level promises"""
+        return backtest_VaR(self.NAV(), window=window, estimators=estimators, confidence_levels=confidence_levels,
+                            n_workers=n_workers)
+
     def current_marginal_risk_of_port_holdings(self, start, end) -> pd.Series:
-        """Returns how much of our volatility is coming from each stock"""
-        if self.__marginal_risk_holdings is None:
-            df = DataReader(self.current_holdings().index, start=start, end=end)['Adj Close']
-            self.__marginal_risk_holdings = df.pct_change().dropna().cov().sum()
-        return self.__marginal_risk_holdings
+        """Returns how much of our volatility is coming from each stock, these add up to our daily volatility"""
+        return self.risk_decomposition(start, end)['component']
 
     def marginal_port_risk(self, ticker: str, start, end) -> float:
         """Returns how much of our volatility the stock is contributing"""
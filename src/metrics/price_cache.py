@@ -0,0 +1,77 @@
+# -----------------------------------------------------------
+# process-wide in-memory cache of price history shared by every DataReader call
+#
+# Stevens Institute of Technology, Hoboken, New Jersey
+# Stevens Student Managed Investment Fund
+# -----------------------------------------------------------
+
+import datetime
+import threading
+import pandas as pd
+from collections import OrderedDict
+
+
+class PriceCache:
+    """Keeps the price history of recently used tickers in memory. Each ticker has one entry covering a date range,
+    any request inside that range is served by slicing it, and a request that overlaps it grows the entry. When the
+    cache holds more than max_rows rows in total the least recently used tickers are dropped. An entry that runs up
+    to the day it was pulled is dropped the next day, since that last day may have been an intraday price."""
+
+    def __init__(self, max_rows=1_000_000):
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()  # ticker -> (start, end, day pulled, prices)
+        self.__rows = 0
+        self.__lock = threading.Lock()
+
+    def get(self, ticker, start, end):
+        """Returns the prices for the ticker between start and end, or None if the cache doesn't cover that range"""
+        start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+        with self.__lock:
+            entry = self.__entries.get(ticker)
+            if entry is not None and entry[1] >= pd.Timestamp(entry[2]) and datetime.date.today() > entry[2]:
+                self.__drop(ticker)
+                entry = None
+            if entry is None or entry[0] > start or entry[1] < end:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.__entries.move_to_end(ticker)
+            return entry[3].loc[start:end].copy()
+
+    def put(self, ticker, start, end, prices: pd.DataFrame):
+        """Adds the prices for the ticker between start and end, merging them with what is cached if the ranges
+        touch"""
+        start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+        with self.__lock:
+            entry = self.__entries.get(ticker)
+            if entry is not None and entry[0] <= end + pd.Timedelta(days=1) and start <= entry[1] + pd.Timedelta(days=1):
+                merged = pd.concat([entry[3][entry[3].index < start], prices, entry[3][entry[3].index > end]])
+                start, end, prices = min(start, entry[0]), max(end, entry[1]), merged
+            if entry is not None:
+                self.__drop(ticker)
+            self.__entries[ticker] = (start, end, datetime.date.today(), prices)
+            self.__rows += len(prices)
+            while self.__rows > self.max_rows and len(self.__entries) > 1:
+                self.__drop(next(iter(self.__entries)))
+
+    def __drop(self, ticker):
+        self.__rows -= len(self.__entries.pop(ticker)[3])
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__rows = 0
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        """Returns the hit and miss counts and how much is cached"""
+        with self.__lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0,
+                    'tickers': len(self.__entries), 'rows': self.__rows}
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,142 @@
+# -----------------------------------------------------------
+# on-disk price store that sits behind DataReader so history is only pulled once
+#
+# Stevens Institute of Technology, Hoboken, New Jersey
+# Stevens Student Managed Investment Fund
+# -----------------------------------------------------------
+
+import os
+import re
+import datetime
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+# same columns (and order) that pandas_datareader gives back for yahoo
+FIELDS = ['High', 'Low', 'Open', 'Close', 'Volume', 'Adj Close']
+
+STORE_DIR = os.environ.get('SSMIF_PRICE_STORE', os.path.join(Path(__file__).parent.absolute(), 'price_data'))
+
+
+def _day(date) -> datetime.date:
+    return pd.Timestamp(date).date()
+
+
+class PriceStore:
+    """Keeps the daily prices of every ticker we have ever asked for in a folder on disk. Each ticker gets one .npz file
+    with its dates, its prices and the date ranges we have already pulled, so a request only goes to the data provider
+    for the days we are actually missing. The file is always replaced whole with one rename, so a reader in another
+    process sees either the old prices or the new ones, never the new dates with the old values."""
+
+    def __init__(self, directory=STORE_DIR):
+        self.directory = directory
+        self.__locks = {}
+        self.__locks_lock = threading.Lock()
+
+    def _lock(self, ticker) -> threading.Lock:
+        with self.__locks_lock:
+            return self.__locks.setdefault(ticker, threading.Lock())
+
+    def _path(self, ticker):
+        name = re.sub(r'[^A-Za-z0-9.\-]', '_', ticker.upper())
+        return os.path.join(self.directory, name + '.npz')
+
+    def _load(self, ticker) -> tuple:
+        """The ticker's (dates, values, covered ranges) arrays, empty if nothing is stored"""
+        try:
+            with np.load(self._path(ticker)) as stored:
+                return stored['dates'], stored['values'], stored['covered']
+        except FileNotFoundError:
+            return (np.array([], dtype='datetime64[D]'), np.empty((0, len(FIELDS))),
+                    np.empty((0, 2), dtype='datetime64[D]'))
+
+    def covered(self, ticker) -> list:
+        """Returns the (start, end) date ranges that have already been pulled for the ticker"""
+        return [(_day(s), _day(e)) for s, e in self._load(ticker)[2]]
+
+    def missing(self, ticker, start, end) -> list:
+        """Returns the (start, end) date ranges between start and end that are not in the store yet. Ranges without a
+        single business day in them are left out since there is nothing to pull for them."""
+        start, end = _day(start), _day(end)
+        gaps = []
+        cursor = start
+        for s, e in sorted(self.covered(ticker)):
+            if e < cursor:
+                continue
+            if s > end:
+                break
+            if s > cursor:
+                gaps.append((cursor, s - datetime.timedelta(days=1)))
+            cursor = max(cursor, e + datetime.timedelta(days=1))
+        if cursor <= end:
+            gaps.append((cursor, end))
+        return [(s, e) for s, e in gaps if np.busday_count(s, e + datetime.timedelta(days=1)) > 0]
+
+    def read(self, ticker, start=None, end=None) -> pd.DataFrame:
+        """Returns the stored prices for the ticker between start and end (inclusive)"""
+        dates, values, _ = self._load(ticker)
+        lo = 0 if start is None else np.searchsorted(dates, np.datetime64(_day(start), 'D'), side='left')
+        hi = len(dates) if end is None else np.searchsorted(dates, np.datetime64(_day(end), 'D'), side='right')
+        index = pd.DatetimeIndex(np.array(dates[lo:hi], dtype='datetime64[ns]'), name='Date')
+        return pd.DataFrame(values[lo:hi], index=index, columns=FIELDS, dtype=float)
+
+    def write(self, ticker, prices: pd.DataFrame, start, end):
+        """Merges new prices for the ticker into the store and records start to end as pulled. Rows already in the
+        store are replaced by the new ones for the same date."""
+        os.makedirs(self.directory, exist_ok=True)
+
+        old = self.read(ticker)
+        new = prices.reindex(columns=FIELDS).astype(float)
+        new.index = pd.DatetimeIndex(new.index).normalize()
+        if len(old) and len(new) and old.index[-1] < new.index[0]:
+            merged = pd.concat([old, new])  # the usual case, new days go on the end
+        else:
+            merged = pd.concat([old[~old.index.isin(new.index)], new]).sort_index()
+
+        # the current day isn't marked as pulled since its prices keep changing until the close
+        end = min(_day(end), datetime.date.today() - datetime.timedelta(days=1))
+        covered = self.covered(ticker)
+        if _day(start) <= end:
+            covered.append((_day(start), end))
+        covered = self._merge_ranges(covered)
+
+        self._save(self._path(ticker), dates=merged.index.values.astype('datetime64[D]'),
+                   values=merged.to_numpy(dtype=float),
+                   covered=np.array(covered, dtype='datetime64[D]').reshape(-1, 2))
+
+    def get(self, ticker, start, end, fetch) -> pd.DataFrame:
+        """Returns the prices for the ticker between start and end, first calling fetch(ticker, start, end) for any
+        range that isn't stored yet and saving what comes back"""
+        with self._lock(ticker):
+            for gap_start, gap_end in self.missing(ticker, start, end):
+                self.write(ticker, fetch(ticker, gap_start, gap_end), gap_start, gap_end)
+            return self.read(ticker, start, end)
+
+    def clear(self, ticker):
+        """Deletes everything stored for the ticker"""
+        with self._lock(ticker):
+            if os.path.exists(self._path(ticker)):
+                os.remove(self._path(ticker))
+
+    @staticmethod
+    def _merge_ranges(ranges) -> list:
+        merged = []
+        for s, e in sorted(ranges):
+            if merged and s <= merged[-1][1] + datetime.timedelta(days=1):
+                merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+            else:
+                merged.append((s, e))
+        return merged
+
+    @staticmethod
+    def _save(path, **arrays):
+        # written to a temp file of its own first (two processes can be writing the same ticker) and then renamed over
+        # the old one, which is atomic
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix='.tmp', delete=False) as f:
+            np.savez(f, **arrays)
+        os.replace(f.name, path)
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,135 @@
+# -----------------------------------------------------------
+# price data providers for DataReader and a batching layer to pull many tickers at once
+#
+# Stevens Institute of Technology, Hoboken, New Jersey
+# Stevens Student Managed Investment Fund
+# -----------------------------------------------------------
+
+import os
+import time
+import zlib
+import sqlite3
+import logging
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from src.metrics.price_store import FIELDS
+
+
+class PriceProvider:
+    """Something DataReader can pull daily prices from. A provider only has to implement fetch, which returns a
+    DataFrame indexed by date with the columns 'High', 'Low', 'Open', 'Close', 'Volume' and 'Adj Close' for a
+    single ticker. Providers can be called directly, provider(ticker, start, end), which is what the price store
+    expects."""
+
+    def fetch(self, ticker, start, end) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def __call__(self, ticker, start, end) -> pd.DataFrame:
+        return self.fetch(ticker, start, end)
+
+
+class YahooProvider(PriceProvider):
+    """Pulls prices from yahoo through pandas_datareader, needs a network connection"""
+
+    def fetch(self, ticker, start, end) -> pd.DataFrame:
+        import pandas_datareader as pdr
+        return pdr.DataReader(ticker, 'yahoo', start=start, end=end)
+
+
+class CSVDirectoryProvider(PriceProvider):
+    """Reads prices from a folder with one csv per ticker, named like AAPL.csv, with a 'Date' column and the usual
+    yahoo columns. If there is no 'Adj Close' column the 'Close' column is used for it."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def fetch(self, ticker, start, end) -> pd.DataFrame:
+        path = os.path.join(self.directory, '{}.csv'.format(ticker.upper()))
+        prices = pd.read_csv(path, index_col='Date', parse_dates=['Date']).sort_index()
+        if 'Adj Close' not in prices.columns:
+            prices['Adj Close'] = prices['Close']
+        return prices.loc[pd.Timestamp(start):pd.Timestamp(end)].reindex(columns=FIELDS)
+
+
+class SQLiteProvider(PriceProvider):
+    """Reads prices from a sqlite table with a 'Ticker' column, a 'Date' column stored as YYYY-MM-DD text and one
+    column for each of the yahoo fields (with 'Adj Close' written as Adj_Close)"""
+
+    def __init__(self, dbfile, table='prices'):
+        self.dbfile = dbfile
+        self.table = table
+
+    def fetch(self, ticker, start, end) -> pd.DataFrame:
+        conn = sqlite3.connect(self.dbfile)
+        try:
+            prices = pd.read_sql_query(
+                """SELECT Date, High, Low, Open, Close, Volume, Adj_Close FROM {} WHERE Ticker = ? AND Date BETWEEN ? AND ?
+                ORDER BY Date;""".format(self.table),
+                conn, params=(ticker.upper(), str(pd.Timestamp(start).date()), str(pd.Timestamp(end).date())),
+                index_col='Date', parse_dates=['Date'])
+        finally:
+            conn.close()
+        return prices.rename(columns={'Adj_Close': 'Adj Close'})
+
+
+class SyntheticProvider(PriceProvider):
+    """Makes up prices with a geometric brownian motion, for tests and for working without a network. The path of
+    each ticker only depends on the ticker and the seed, so asking for different ranges gives consistent prices."""
+
+    origin = pd.Timestamp('1990-01-01')
+
+    def __init__(self, mu=0.07, sigma=0.2, start_price=100.0, seed=0):
+        self.mu = mu
+        self.sigma = sigma
+        self.start_price = start_price
+        self.seed = seed
+
+    def fetch(self, ticker, start, end) -> pd.DataFrame:
+        days = np.arange(np.datetime64(self.origin.date()), np.datetime64(pd.Timestamp(end).date()) + 1)
+        dates = days[np.is_busday(days)]
+        rng = np.random.default_rng([self.seed, zlib.crc32(ticker.upper().encode())])
+        daily = rng.normal((self.mu - self.sigma ** 2 / 2) / 252, self.sigma / np.sqrt(252), size=(len(dates), 2))
+        close = self.start_price * np.exp(np.cumsum(daily[:, 0]))
+        spread = np.abs(daily[:, 1]) * close
+        prices = pd.DataFrame({'High': close + spread, 'Low': close - spread, 'Open': close * np.exp(-daily[:, 0] / 2),
+                               'Close': close, 'Volume': np.full(len(dates), 1e6), 'Adj Close': close},
+                              index=pd.DatetimeIndex(dates.astype('datetime64[ns]'), name='Date'))
+        return prices.loc[pd.Timestamp(start):pd.Timestamp(end)]
+
+
+def fetch_many(fetch, tickers, start, end, max_workers=8, retries=2, backoff=0.5):
+    """Calls fetch(ticker, start, end) for every ticker on a pool of at most max_workers threads. Each ticker is
+    retried up to retries times, waiting backoff, 2 * backoff, ... seconds in between. A ticker that still fails
+    doesn't stop the others, its exception is returned instead.
+
+    Returns a dict of ticker -> prices for the tickers that worked and a dict of ticker -> exception for the ones
+    that didn't."""
+
+    def attempt(ticker):
+        for tries in range(retries + 1):
+            try:
+                return fetch(ticker, start, end)
+            except Exception as e:
+                if tries == retries:
+                    raise
+                logging.info('{} failed ({}), retrying'.format(ticker, e))
+                time.sleep(backoff * 2 ** tries)
+
+    tickers = list(dict.fromkeys(tickers))
+    results, errors = {}, {}
+    if not tickers:
+        return results, errors
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tickers)))) as pool:
+        futures = {ticker: pool.submit(attempt, ticker) for ticker in tickers}
+        for ticker, future in futures.items():
+            try:
+                results[ticker] = future.result()
+            except Exception as e:
+                logging.warning('could not get prices for {}: {}'.format(ticker, e))
+                errors[ticker] = e
+    return results, errors
+
+
+if __name__ == '__main__':
+    pass
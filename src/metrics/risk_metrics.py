@@ -81,7 +81,7 @@ def maximum_drawdown(price_data: pd.Series, window=252) -> float:
 	# Daily_Drawdown.plot()
 	# Max_Daily_Drawdown.plot()
 	# plt.show()
-	return Max_Daily_Drawdown[-1]
+	return Max_Daily_Drawdown.iloc[-1]
 
 
 def pain_index(price_data: pd.Series, window=252) -> float:
@@ -110,6 +110,47 @@ def ATR(price_points_data: pd.DataFrame, window=14) -> float:
 	return total_true_range / window
 
 
+def true_range(high, low, close):
+	"""Returns the true range for every day, the largest of today's high minus low and the distance from yesterday's
+	close to today's high or low. Works on a Series for one stock or on DataFrames with a column per stock. The first
+	day has no previous close so it is just the high minus the low."""
+	previous_close = close.shift(1)
+	ranges = [high - low, (high - previous_close).abs(), (low - previous_close).abs()]
+	if isinstance(high, pd.DataFrame):
+		return pd.DataFrame(np.fmax(np.fmax(ranges[0].to_numpy(), ranges[1].to_numpy()), ranges[2].to_numpy()),
+							index=high.index, columns=high.columns)
+	return pd.concat(ranges, axis=1).max(axis=1)
+
+
+def ATR_series(high, low, close, window=14, smoothing='wilder'):
+	"""Returns the average true range for every day, for one stock (Series) or for every column of High/Low/Close
+	DataFrames at once. smoothing='simple' is the plain rolling mean of the true range. smoothing='wilder' is
+	Wilder's original ATR: a simple mean of the first window days and after that
+	ATR = (previous ATR * (window - 1) + true range) / window.
+	For more information go to https://www.investopedia.com/terms/a/atr.asp"""
+	tr = true_range(high, low, close)
+	seed = tr.rolling(window, min_periods=window).mean()
+	if smoothing == 'simple':
+		return seed
+	if smoothing != 'wilder':
+		raise ValueError("smoothing must be 'simple' or 'wilder', got {}".format(smoothing))
+
+	# the first full window (per stock, since they can start on different days) seeds the recursion and every day
+	# after that is fed to an exponential average with alpha = 1 / window, which is Wilder's smoothing
+	started = seed.notna().cumsum() > 0
+	first = started & ~started.shift(1, fill_value=False)
+	values = tr.where(started).mask(first, seed)
+	return values.ewm(alpha=1 / window, adjust=False).mean().where(started)
+
+
+def stop_loss_levels(high, low, close, window=14, multiplier=2.0, smoothing='wilder'):
+	"""Returns the stop-loss price for every column: the latest close minus multiplier times the latest ATR. Pass
+	the High/Low/Close DataFrames of the whole book (e.g. DataReader(tickers, start, end)['High']) to get every stop
+	loss in one call."""
+	atr = ATR_series(high, low, close, window=window, smoothing=smoothing)
+	return (close.ffill().iloc[-1] - multiplier * atr.ffill().iloc[-1]).rename('Stop_Loss')
+
+
 if __name__ == '__main__':
 	import pandas_datareader as pdr
 	aapl = pdr.DataReader('AAPL', 'yahoo', '2018-01-01', '2019-01-01')['Adj Close']
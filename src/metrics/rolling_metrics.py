@@ -0,0 +1,71 @@
+# -----------------------------------------------------------
+# whole time series of the risk metrics for charting, computed in a single pass
+#
+# Stevens Institute of Technology, Hoboken, New Jersey
+# Stevens Student Managed Investment Fund
+# -----------------------------------------------------------
+
+import numpy as np
+import pandas as pd
+from math import sqrt
+from src.metrics.streaming_metrics import RollingExtreme
+
+
+def rolling_drawdowns(price_data: pd.Series, window=252) -> pd.DataFrame:
+    """Returns a DataFrame with the drawdown from the rolling window high and the maximum drawdown for every day.
+    The maximum drawdown on a day is what risk_metrics.maximum_drawdown would give for the prices up to that day.
+    Both rolling extremes are kept with monotonic deques so the whole thing is O(n) no matter the window."""
+    prices = price_data.to_numpy(dtype=float)
+    peak = RollingExtreme(window, 'max')
+    worst = RollingExtreme(window, 'min')
+    drawdown = np.empty(len(prices))
+    max_drawdown = np.empty(len(prices))
+    for i, price in enumerate(prices):
+        drawdown[i] = price / peak.push(price) - 1.0
+        max_drawdown[i] = worst.push(drawdown[i])
+    return pd.DataFrame({'drawdown': drawdown, 'maximum_drawdown': max_drawdown}, index=price_data.index)
+
+
+def rolling_pain_index(drawdown: pd.Series) -> pd.Series:
+    """Returns the pain index for every day given the drawdown series from rolling_drawdowns, i.e. what
+    risk_metrics.pain_index would give for the prices up to that day. A cumulative sum makes it O(n)."""
+    pain = np.cumsum(np.abs(drawdown.to_numpy(dtype=float))) / np.arange(1, len(drawdown) + 1)
+    return pd.Series(pain, index=drawdown.index)
+
+
+def rolling_monthly_vol(price_data: pd.Series, window=252) -> pd.Series:
+    """Returns risk_metrics.monthly_vol over the trailing window of returns for every day, from cumulative sums of
+    the returns and squared returns. Days before a full window are NaN."""
+    returns = price_data.pct_change().to_numpy(dtype=float)[1:]
+    vol = np.full(len(price_data), np.nan)
+    if len(returns) >= window > 1:
+        centered = returns - returns.mean()  # keeps the running sums small so the subtraction below stays accurate
+        s1 = np.concatenate([[0.0], np.cumsum(centered)])
+        s2 = np.concatenate([[0.0], np.cumsum(centered ** 2)])
+        sum1 = s1[window:] - s1[:-window]
+        sum2 = s2[window:] - s2[:-window]
+        var = np.maximum((sum2 - sum1 ** 2 / window) / (window - 1), 0.0)
+        vol[window:] = np.sqrt(var) * sqrt(252 / 12)
+    return pd.Series(vol, index=price_data.index)
+
+
+def rolling_VaR(price_data: pd.Series, window=252, confidence_level=0.05) -> pd.Series:
+    """Returns risk_metrics.VaR over the trailing window of returns for every day. Days before a full window are
+    NaN."""
+    returns = price_data.pct_change()
+    return returns.rolling(window, min_periods=window).quantile(confidence_level) * sqrt(252 / 12)
+
+
+def rolling_metrics(price_data: pd.Series, window=252, confidence_level=0.05) -> pd.DataFrame:
+    """Returns a DataFrame with a row for every day and the drawdown, maximum drawdown, pain index, monthly vol and
+    VaR as of that day, all with the given window. This is what the dashboard charts use instead of calling the
+    risk_metrics functions once per day."""
+    metrics = rolling_drawdowns(price_data, window=window)
+    metrics['pain_index'] = rolling_pain_index(metrics['drawdown'])
+    metrics['monthly_vol'] = rolling_monthly_vol(price_data, window=window)
+    metrics['VaR'] = rolling_VaR(price_data, window=window, confidence_level=confidence_level)
+    return metrics
+
+
+if __name__ == '__main__':
+    pass
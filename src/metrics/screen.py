@@ -0,0 +1,245 @@
+# -----------------------------------------------------------
+# the risk screen analysts run on a stock before pitching it, with its inputs fetched and metrics run concurrently
+#
+# Stevens Institute of Technology, Hoboken, New Jersey
+# Stevens Student Managed Investment Fund
+# -----------------------------------------------------------
+
+import time
+import logging
+import datetime
+import numpy as np
+import pandas as pd
+from math import sqrt
+from concurrent.futures import ThreadPoolExecutor
+from src.metrics import risk_metrics, panel_metrics
+from src.metrics.ssmif_datareader import DataReader
+from src.metrics.base_portfolio import base_portfolio, tail_risk, CURVE_SIZES
+from src.metrics.screen_cache import screen_cache
+
+BENCHMARK = '^GSPC'
+
+# the most monthly portfolio VaR (as a loss, in percent) a new position may take us to before it fails the screen
+PORTFOLIO_VAR_LIMIT = 15
+
+
+def screen_start(years, today=None) -> datetime.date:
+    today = datetime.date.today() if today is None else today
+    return today.replace(year=today.year - int(years))
+
+
+def screen_inputs(ticker, sector, start, end) -> pd.DataFrame:
+    """Adjusted closes of the ticker, its sector ETF and the benchmark, pulled in one concurrent DataReader call"""
+    prices = DataReader(list(dict.fromkeys([ticker, sector, BENCHMARK])), start=start, end=end)['Adj Close']
+    if prices[ticker].isna().all():
+        raise ValueError('no prices for {}'.format(ticker))
+    return prices
+
+
+def portfolio_risk(base, ticker, prices: pd.Series, weight=None) -> tuple:
+    """Monthly (VaR, CVaR) of our current book with ticker added at weight (the average weight of our current
+    positions if not given) and everything else scaled down to make room for it, against the day's base portfolio"""
+    returns = prices.pct_change().iloc[1:].to_frame(ticker)
+    risk = base.what_if(returns, weight).loc[ticker]
+    return risk['VaR'], risk['CVaR']
+
+
+def _aligned(a: pd.Series, b: pd.Series) -> tuple:
+    both = pd.concat([a, b], axis=1).dropna()
+    return both.iloc[:, 0], both.iloc[:, 1]
+
+
+def _percent(value) -> str:
+    return '{0:.3g}%'.format(value * 100)
+
+
+def _number(value) -> str:
+    return '{0:.3g}'.format(value)
+
+
+# (name, what it needs, function, formatter). Metrics that need 'prices' get the (ticker, sector, benchmark) closes,
+# the portfolio ones get the (VaR, CVaR) of the book with the ticker added, from the day's base portfolio
+SCREEN_METRICS = [
+    ('Portfolio VaR w/ {ticker}', 'portfolio', lambda risk, t, s: risk[0], _percent),
+    ('Portfolio CVaR w/ {ticker}', 'portfolio', lambda risk, t, s: risk[1], _percent),
+    ('Monthly VaR', 'prices', lambda p, t, s: risk_metrics.VaR(p[t].dropna()), _percent),
+    # negative like risk_metrics.VaR, risk_metrics.CVaR is (1 - the tail mean) so it can't sit next to it
+    ('Monthly CVaR', 'prices', lambda p, t, s: -tail_risk(p[t].pct_change().dropna())[1], _percent),
+    ('Monthly Semi Dev', 'prices', lambda p, t, s: risk_metrics.semi_deviation(p[t].dropna()) * sqrt(252 / 12),
+     _percent),
+    ('Daily Max Drawdown', 'prices', lambda p, t, s: risk_metrics.maximum_drawdown(p[t].dropna()), _percent),
+    ('Monthly Pain Index', 'prices', lambda p, t, s: risk_metrics.pain_index(p[t].dropna()), _percent),
+    ('Monthly Beta', 'prices', lambda p, t, s: risk_metrics.beta(*_aligned(p[t], p[BENCHMARK])), _number),
+    ('Sector Beta', 'prices', lambda p, t, s: risk_metrics.beta(*_aligned(p[t], p[s])), _number),
+    ('Monthly Variance', 'prices', lambda p, t, s: risk_metrics.monthly_vol(p[t].dropna()) ** 2, _percent),
+    ('Monthly Historical Volatility', 'prices', lambda p, t, s: risk_metrics.monthly_vol(p[t].dropna()), _percent),
+]
+
+
+def pass_fail(name, value) -> str:
+    if name.startswith('Portfolio VaR'):
+        return 'fail' if value * 100 > PORTFOLIO_VAR_LIMIT else 'pass'
+    return ''
+
+
+def _timed(function, *args):
+    start = time.perf_counter()
+    return function(*args), time.perf_counter() - start
+
+
+def run_screen(ticker, sector, years, today=None, weight=None, max_workers=8, on_result=None) -> list:
+    """Runs the risk screen for ticker against its sector ETF over the last years years. Returns a row per metric
+    with its formatted value, pass/fail and how many seconds it took; a metric that fails shows 'Error' without
+    stopping the others.
+
+    The three price series and the day's base portfolio (see base_portfolio) are fetched at the same time, the
+    portfolio VaR and CVaR are both read off one update of it with the ticker's returns, and the metrics run on a
+    thread pool as soon as their input is ready.
+    on_result(index, total, row) is called as each metric finishes, for progress reporting. Raises if the ticker's
+    prices can't be pulled, like the old screen returning 'Error'."""
+    ticker, sector = ticker.upper(), sector.upper()
+    start, end = screen_start(years, today), datetime.date.today() if today is None else today
+    rows = [None] * len(SCREEN_METRICS)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        inputs = {'prices': pool.submit(_timed, screen_inputs, ticker, sector, start, end),
+                  'base': pool.submit(base_portfolio, start, end)}
+        prices, fetch_seconds = inputs['prices'].result()
+        # submitted before the metrics, so it is never stuck behind ones waiting for it
+        inputs['portfolio'] = pool.submit(_timed, lambda: portfolio_risk(inputs['base'].result(), ticker,
+                                                                         prices[ticker], weight))
+
+        def evaluate(index):
+            name, needs, function, formatter = SCREEN_METRICS[index]
+            name = name.format(ticker=ticker)
+            try:
+                data, seconds = (prices, 0.0) if needs == 'prices' else inputs[needs].result()
+                value, metric_seconds = _timed(function, data, ticker, sector)
+                row = {'metric': name, 'value': formatter(value), 'pf': pass_fail(name, value),
+                       'seconds': round(seconds + metric_seconds, 4)}
+            except Exception as e:
+                logging.info('{}: '.format(name))
+                logging.info(e)
+                row = {'metric': name, 'value': 'Error', 'pf': '', 'seconds': None}
+            rows[index] = row
+            if on_result is not None:
+                on_result(index, len(rows), row)
+
+        list(pool.map(evaluate, range(len(SCREEN_METRICS))))
+    logging.info('screen {} fetched prices in {:.3f}s'.format(ticker, fetch_seconds))
+    return rows
+
+
+def cached_screen(ticker, sector, years, today=None, weight=None, cache=screen_cache, **kwargs) -> list:
+    """run_screen through the screen cache. A screen where any metric errored isn't cached, so a failed data pull
+    is retried next time."""
+    key = cache.key(ticker, sector, years, weight, today)
+    rows = cache.get(key)
+    if rows is None:
+        rows = run_screen(ticker, sector, years, today=today, weight=weight, **kwargs)
+        if all(row['value'] != 'Error' for row in rows):
+            cache.put(key, rows)
+    return rows
+
+
+def _column(name) -> str:
+    # the universe table has one column per metric, named without the ticker
+    return name.replace(' w/ {ticker}', '')
+
+
+def _universe_metrics(prices, tickers, sectors, base, weight) -> pd.DataFrame:
+    candidates = prices[tickers]
+    table = pd.DataFrame({'sector': [sectors[t] for t in tickers]}, index=pd.Index(tickers, name='ticker'))
+    if base is not None:
+        risk = base.what_if(candidates.pct_change().iloc[1:], weight)
+        table['Portfolio VaR'], table['Portfolio CVaR'] = risk['VaR'], risk['CVaR']
+    else:
+        table['Portfolio VaR'] = table['Portfolio CVaR'] = np.nan
+    table['Monthly VaR'] = panel_metrics.VaR(candidates)
+    # panel_metrics.CVaR is (1 - the tail mean) * sqrt(21) like risk_metrics.CVaR, this is the tail mean like the
+    # single screen
+    table['Monthly CVaR'] = sqrt(252 / 12) - panel_metrics.CVaR(candidates)
+    table['Monthly Semi Dev'] = panel_metrics.semi_deviation(candidates) * sqrt(252 / 12)
+    table['Daily Max Drawdown'] = panel_metrics.maximum_drawdown(candidates)
+    table['Monthly Pain Index'] = panel_metrics.pain_index(candidates)
+    table['Monthly Beta'] = panel_metrics.beta(candidates, prices[BENCHMARK])
+    table['Sector Beta'] = np.nan
+    for sector in dict.fromkeys(sectors[t] for t in tickers):
+        if sector is not None:
+            members = [t for t in tickers if sectors[t] == sector]
+            table.loc[members, 'Sector Beta'] = panel_metrics.beta(candidates[members], prices[sector]).to_numpy()
+    vol = panel_metrics.monthly_vol(candidates)
+    table['Monthly Variance'], table['Monthly Historical Volatility'] = vol ** 2, vol
+    return table
+
+
+def screen_universe(universe, years, sector=None, today=None, weight=None) -> tuple:
+    """The risk screen for a whole list of candidates at once. universe is either a list of tickers, all screened
+    against sector (Sector Beta is left out without one), or a dict of {sector ETF: [tickers]}.
+
+    Every ticker, sector ETF and the benchmark are pulled in one DataReader call, the portfolio metrics are updates of
+    the day's base portfolio, and
+    each metric is worked out for all the candidates together with panel_metrics, so a few hundred names take
+    seconds. Returns a DataFrame with a row per ticker (the same metrics as SCREEN_METRICS, plus its sector, pass/fail
+    and rank, where rank 1 adds the least portfolio VaR and the ones that fail come last) and the list of tickers
+    that had no prices."""
+    if isinstance(universe, dict):
+        sectors = {t.upper(): s.upper() for s, tickers in universe.items() for t in tickers}
+    else:
+        sectors = {t.upper(): None if sector is None else sector.upper() for t in universe}
+    start, end = screen_start(years, today), datetime.date.today() if today is None else today
+    symbols = list(dict.fromkeys(list(sectors) + [s for s in sectors.values() if s is not None] + [BENCHMARK]))
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        base = pool.submit(base_portfolio, start, end)
+        prices = DataReader(symbols, start=start, end=end)['Adj Close']
+        try:
+            base = base.result()
+        except Exception as e:
+            logging.info('universe screen: ')
+            logging.info(e)
+            base = None
+
+    missing = [t for t in sectors if prices[t].isna().all()]
+    tickers = [t for t in sectors if t not in missing]
+    table = _universe_metrics(prices, tickers, sectors, base, weight)
+
+    table['pf'] = [pass_fail('Portfolio VaR', value) if not np.isnan(value) else '' for value in table['Portfolio VaR']]
+    table['failed'] = table['pf'] == 'fail'
+    table = table.sort_values(['failed', 'Portfolio VaR'], na_position='last', kind='stable').drop(columns='failed')
+    table.insert(1, 'rank', np.arange(1, len(table) + 1))
+    return table, missing
+
+
+def universe_rows(table: pd.DataFrame) -> list:
+    """The screen_universe table as a list of {'rank', 'ticker', 'sector', 'pf', 'metrics'}, in rank order, with
+    metrics formatted like run_screen's rows"""
+    rows = []
+    for ticker, row in table.iterrows():
+        metrics = []
+        for name, needs, function, formatter in SCREEN_METRICS:
+            value, name = row[_column(name)], name.format(ticker=ticker)
+            metrics.append({'metric': name, 'value': 'N/A' if np.isnan(value) else formatter(value),
+                            'pf': '' if np.isnan(value) else pass_fail(name, value)})
+        rows.append({'rank': int(row['rank']), 'ticker': ticker, 'sector': row['sector'], 'pf': row['pf'],
+                     'metrics': metrics})
+    return rows
+
+
+def size_curve(ticker, years, today=None, sizes=CURVE_SIZES) -> list:
+    """Portfolio VaR, CVaR and volatility with ticker added at each of sizes (0 to 10% unless given), for seeing how
+    big a position can get before it fails the screen. Returns a row per size, {'weight', 'VaR', 'CVaR',
+    'volatility', 'pf'}, with the numbers formatted like run_screen's"""
+    ticker = ticker.upper()
+    start, end = screen_start(years, today), datetime.date.today() if today is None else today
+    prices = DataReader([ticker], start=start, end=end)['Adj Close'][ticker]
+    if prices.isna().all():
+        raise ValueError('no prices for {}'.format(ticker))
+    curve = base_portfolio(start, end).size_curve(prices.pct_change().iloc[1:].rename(ticker), sizes)
+    return [{'weight': _percent(size), 'VaR': _percent(row['VaR']), 'CVaR': _percent(row['CVaR']),
+             'volatility': _percent(row['volatility']), 'pf': pass_fail('Portfolio VaR', row['VaR'])}
+            for size, row in curve.iterrows()]
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,138 @@
+# -----------------------------------------------------------
+# cache of risk screen results so a repeat screen of the same name comes back in milliseconds
+#
+# Stevens Institute of Technology, Hoboken, New Jersey
+# Stevens Student Managed Investment Fund
+# -----------------------------------------------------------
+
+import os
+import json
+import time
+import datetime
+import threading
+import pandas as pd
+from collections import OrderedDict
+from src.metrics.nav_store import POSITIONS_CSV, last_close
+from src.database.connection import ConnectionPool
+
+SCREEN_CACHE_DB = os.environ.get('SSMIF_SCREEN_CACHE')  # an sqlite file to share results across processes, if set
+
+# the screen's portfolio metrics depend on what we hold, which comes from the positions csv, so a change to it empties
+# the cache. The database isn't watched: it is written for every new transaction and cached table, none of which the
+# screen reads
+WATCHED_FILES = [POSITIONS_CSV]
+
+
+def price_day(today=None) -> datetime.date:
+    """The day of the last close a screen's prices run up to: the latest close so far (see nav_store.last_close) for
+    a screen as of today, so results are reused until the next close, and the last business day on or before today
+    for one as of another day"""
+    if today is None or today == datetime.date.today():
+        return last_close().date()
+    return pd.offsets.BDay().rollback(pd.Timestamp(today)).date()
+
+
+def files_version(paths=WATCHED_FILES) -> str:
+    """A token that changes whenever one of the files is written (or created or deleted)"""
+    stamps = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stamps.append('{}:{}'.format(stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            stamps.append('-')
+    return '|'.join(stamps)
+
+
+class ScreenCache:
+    """Keeps screen results in memory for ttl seconds, keyed on (ticker, sector, years, weight, price day) so a new
+    close is always a miss, with at most max_entries kept and the least recently used dropped first. Every entry is
+    stamped with the version of our positions (see files_version) and is thrown away once that changes.
+
+    With db set, results are also written to an sqlite table so other processes (and restarts) can reuse them; a
+    miss in memory checks there before giving up."""
+
+    def __init__(self, max_entries=512, ttl=3600, db=SCREEN_CACHE_DB, version=files_version):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = version
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()  # key -> (time stored, version, rows)
+        self.__lock = threading.Lock()
+        self.__pool = None
+        if db is not None:
+            self.__pool = ConnectionPool(db, size=4)
+            with self.__pool.transaction() as conn:
+                conn.execute("""CREATE TABLE IF NOT EXISTS screens (key TEXT PRIMARY KEY, stored REAL NOT NULL,
+                                version TEXT NOT NULL, rows TEXT NOT NULL);""")
+
+    @staticmethod
+    def key(ticker, sector, years, weight=None, today=None) -> tuple:
+        return ticker.upper(), sector.upper(), int(years), weight, price_day(today).isoformat()
+
+    def get(self, key):
+        """Returns the cached rows for the key, or None"""
+        now, version = time.time(), self.version()
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and (now - entry[0] > self.ttl or entry[1] != version):
+                del self.__entries[key]
+                entry = None
+            if entry is not None:
+                self.hits += 1
+                self.__entries.move_to_end(key)
+                return entry[2]
+
+        if self.__pool is not None:
+            row = self.__pool.query("""SELECT stored, version, rows FROM screens WHERE key = ?;""", (json.dumps(key),))
+            if row and now - row[0][0] <= self.ttl and row[0][1] == version:
+                rows = json.loads(row[0][2])
+                with self.__lock:
+                    self.db_hits += 1
+                    self.__store(key, (row[0][0], version, rows))
+                return rows
+
+        with self.__lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, rows):
+        entry = (time.time(), self.version(), rows)
+        with self.__lock:
+            self.__store(key, entry)
+        if self.__pool is not None:
+            with self.__pool.transaction() as conn:
+                conn.execute("""INSERT OR REPLACE INTO screens VALUES (?, ?, ?, ?);""",
+                             (json.dumps(key), entry[0], entry[1], json.dumps(rows)))
+                conn.execute("""DELETE FROM screens WHERE stored < ?;""", (entry[0] - self.ttl,))
+
+    def __store(self, key, entry):
+        self.__entries[key] = entry
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.max_entries:
+            self.__entries.popitem(last=False)
+
+    def clear(self):
+        """Empties the cache, e.g. after the positions csv is corrected by hand"""
+        with self.__lock:
+            self.__entries.clear()
+        if self.__pool is not None:
+            with self.__pool.transaction() as conn:
+                conn.execute("""DELETE FROM screens;""")
+
+    def stats(self) -> dict:
+        """Returns the hit and miss counts and how many screens are cached"""
+        with self.__lock:
+            lookups = self.hits + self.db_hits + self.misses
+            return {'hits': self.hits, 'db_hits': self.db_hits, 'misses': self.misses,
+                    'hit_rate': (self.hits + self.db_hits) / lookups if lookups else 0.0,
+                    'entries': len(self.__entries)}
+
+
+screen_cache = ScreenCache()
+
+
+if __name__ == '__main__':
+    pass
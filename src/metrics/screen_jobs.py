@@ -0,0 +1,135 @@
+# -----------------------------------------------------------
+# risk screens run in the background, so a request only has to start one and then check on it
+#
+# Stevens Institute of Technology, Hoboken, New Jersey
+# Stevens Student Managed Investment Fund
+# -----------------------------------------------------------
+
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from src.metrics.screen import SCREEN_METRICS, cached_screen
+
+QUEUED, RUNNING, DONE, ERROR = 'queued', 'running', 'done', 'error'
+
+
+class ScreenJob:
+    """One screen and how far it has got. results has a slot per metric in SCREEN_METRICS order, None until that
+    metric is done, and version goes up every time anything changes so a watcher can tell when to look again."""
+
+    def __init__(self, ticker, sector, years, kwargs):
+        self.id = uuid.uuid4().hex
+        self.ticker, self.sector, self.years, self.kwargs = ticker.upper(), sector.upper(), int(years), kwargs
+        self.state = QUEUED
+        self.results = [None] * len(SCREEN_METRICS)
+        self.num = 0
+        self.metric = None
+        self.error = None
+        self.submitted = time.time()
+        self.finished = None
+        self.version = 0
+
+    def status(self) -> dict:
+        return {'id': self.id, 'ticker': self.ticker, 'sector': self.sector, 'years': self.years, 'state': self.state,
+                'num': self.num, 'total': len(self.results), 'metric': self.metric, 'results': list(self.results),
+                'error': self.error}
+
+
+class ScreenJobs:
+    """Runs screens (through cached_screen) on a pool of max_workers threads and keeps their progress, so a request
+    only has to submit one and the page can poll status() or follow events() while the metrics come in.
+
+    Finished jobs are kept for ttl seconds, and at most keep of them, for the page to pick up its results."""
+
+    def __init__(self, max_workers=4, keep=256, ttl=3600, screen=cached_screen):
+        self.keep = keep
+        self.ttl = ttl
+        self.screen = screen
+        self.__pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='screen-job')
+        self.__jobs = OrderedDict()  # id -> ScreenJob, oldest first
+        self.__changed = threading.Condition()
+
+    def submit(self, ticker, sector, years, **kwargs) -> str:
+        """Queues a screen and returns its job id straight away. kwargs go on to cached_screen, e.g. today or
+        weight"""
+        job = ScreenJob(ticker, sector, years, kwargs)
+        with self.__changed:
+            self.__prune()
+            self.__jobs[job.id] = job
+        self.__pool.submit(self.__run, job)
+        return job.id
+
+    def __run(self, job):
+        self.__update(job, state=RUNNING)
+
+        def on_result(index, total, row):
+            with self.__changed:
+                job.results[index] = row
+                job.num += 1
+                job.metric = row['metric']
+                job.version += 1
+                self.__changed.notify_all()
+
+        try:
+            rows = self.screen(job.ticker, job.sector, job.years, on_result=on_result, **job.kwargs)
+        except Exception as e:
+            logging.info('screen job {} ({}): '.format(job.id, job.ticker))
+            logging.info(e)
+            self.__update(job, state=ERROR, error=str(e), finished=time.time())
+            return
+        # a cached screen comes back whole without calling on_result
+        self.__update(job, state=DONE, results=list(rows), num=len(rows), finished=time.time())
+
+    def __update(self, job, **changes):
+        with self.__changed:
+            for name, value in changes.items():
+                setattr(job, name, value)
+            job.version += 1
+            self.__changed.notify_all()
+
+    def __prune(self):
+        now = time.time()
+        finished = [job for job in self.__jobs.values() if job.finished is not None]
+        for i, job in enumerate(finished):
+            if i < len(finished) - self.keep or now - job.finished > self.ttl:
+                del self.__jobs[job.id]
+
+    def status(self, job_id) -> dict:
+        """The job's state ('queued', 'running', 'done' or 'error'), how many of the total metrics are done, the last
+        one to finish and the results so far. Raises KeyError for an unknown (or expired) job"""
+        with self.__changed:
+            return self.__jobs[job_id].status()
+
+    def events(self, job_id, heartbeat=15.0):
+        """Yields the job's status every time it changes until it is done or has failed, and at least every
+        heartbeat seconds (None if nothing changed, to keep the connection alive). Raises KeyError for an unknown
+        job"""
+        with self.__changed:
+            job = self.__jobs[job_id]  # looked up here rather than in the generator so a bad id raises right away
+        return self.__follow(job, heartbeat)
+
+    def __follow(self, job, heartbeat):
+        seen = -1
+        while True:
+            with self.__changed:
+                self.__changed.wait_for(lambda: job.version != seen, timeout=heartbeat)
+                status = job.status() if job.version != seen else None
+                seen = job.version
+            yield status
+            if status is not None and status['state'] in (DONE, ERROR):
+                return
+
+    def stats(self) -> dict:
+        with self.__changed:
+            states = [job.state for job in self.__jobs.values()]
+        return {state: states.count(state) for state in (QUEUED, RUNNING, DONE, ERROR)}
+
+
+screen_jobs = ScreenJobs()
+
+
+if __name__ == '__main__':
+    pass
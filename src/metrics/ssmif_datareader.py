@@ -6,15 +6,59 @@
 # email jamezqui@stevens.edu
 # -----------------------------------------------------------
 
+import numpy as np
+import pandas as pd
+from src.metrics.price_store import PriceStore, FIELDS
+from src.metrics.price_cache import PriceCache
+from src.metrics.providers import YahooProvider, fetch_many
 
-def DataReader(ticker, start, end):
+price_store = PriceStore()
+price_cache = PriceCache()
+default_provider = YahooProvider()
+
+
+def set_provider(provider):
+    """Changes where DataReader pulls prices from when they aren't in the price store, e.g. a CSVDirectoryProvider
+    or a SyntheticProvider to run without a network"""
+    global default_provider
+    default_provider = provider
+    price_cache.clear()
+
+
+def _read(ticker, start, end, provider) -> pd.DataFrame:
+    """Prices for one ticker, from the in-memory cache if it has them and the price store otherwise"""
+    prices = price_cache.get(ticker, start, end)
+    if prices is None:
+        prices = price_store.get(ticker, start, end, provider)
+        price_cache.put(ticker, start, end, prices)
+    return prices
+
+
+def DataReader(ticker, start, end, provider=None, max_workers=8):
     """A wrapper for the ssmif api call that gets stock data, the effect is to override the pandas_datareader
     function DataReader. Used in exact same way as pandas_datareader.DataReader, only
-    difference is that it pulls stock data from our database for faster results."""
+    difference is that it pulls stock data from our database for faster results.
+
+    Recently used prices are served from memory (see price_cache.stats() for hit rates) and the rest are kept in
+    the local price store, so only the days that haven't been pulled before are fetched from the provider (yahoo
+    unless set_provider was called) and everything else is read off disk. A list of tickers is pulled on up to
+    max_workers threads at once, and a ticker that can't be pulled comes back as a column of NaNs instead of failing
+    the whole call."""
+    provider = default_provider if provider is None else provider
+    if isinstance(ticker, str):
+        return _read(ticker, start, end, provider)
+
+    tickers = list(ticker)
+    frames, errors = fetch_many(lambda symbol, s, e: _read(symbol, s, e, provider), tickers, start, end,
+                                max_workers=max_workers)
+    for symbol in errors:
+        frames[symbol] = pd.DataFrame(np.nan, index=pd.DatetimeIndex([], name='Date'), columns=FIELDS)
 
-    #for now it'll just be a wrapper for pandas_datareader.DataReader
-    import pandas_datareader as pdr
-    return pdr.DataReader(ticker, 'yahoo', start=start, end=end)
+    # a list of tickers comes back like pandas_datareader does it, columns of (attribute, ticker)
+    panel = pd.concat({field: pd.concat({symbol: frames[symbol][field] for symbol in dict.fromkeys(tickers)}, axis=1)
+                       for field in FIELDS}, axis=1)
+    panel.columns.names = ['Attributes', 'Symbols']
+    return panel
 
 
 if __name__ == '__main__':
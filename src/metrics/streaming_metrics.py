@@ -0,0 +1,230 @@
+# -----------------------------------------------------------
+# risk metrics that update one price at a time, for the end of day refresh
+#
+# Stevens Institute of Technology, Hoboken, New Jersey
+# Stevens Student Managed Investment Fund
+# -----------------------------------------------------------
+
+import json
+from math import sqrt, nan
+from collections import deque
+
+
+class RollingExtreme:
+    """Keeps the max (or min) of the last window values with a monotonic deque, each push costs O(1) on average.
+    With window=None it is the max (or min) of everything pushed so far."""
+
+    def __init__(self, window=None, mode='max'):
+        self.window = window
+        self.mode = mode
+        self.count = 0
+        self.items = deque()  # (position, value) pairs, values only ever get worse from left to right
+
+    def _beats(self, a, b) -> bool:
+        return a >= b if self.mode == 'max' else a <= b
+
+    def push(self, value) -> float:
+        """Adds a value and returns the max (or min) of the window that now ends with it"""
+        while self.items and self._beats(value, self.items[-1][1]):
+            self.items.pop()
+        self.items.append((self.count, value))
+        if self.window is not None and self.items[0][0] <= self.count - self.window:
+            self.items.popleft()
+        self.count += 1
+        return self.items[0][1]
+
+    @property
+    def value(self) -> float:
+        return self.items[0][1] if self.items else nan
+
+    def to_dict(self) -> dict:
+        return {'window': self.window, 'mode': self.mode, 'count': self.count, 'items': [list(i) for i in self.items]}
+
+    @classmethod
+    def from_dict(cls, state: dict):
+        extreme = cls(window=state['window'], mode=state['mode'])
+        extreme.count = state['count']
+        extreme.items = deque(tuple(i) for i in state['items'])
+        return extreme
+
+
+class Accumulator:
+    """Base class for the streaming metrics. Subclasses keep their state in plain attributes listed in _state so it
+    can be saved to json and loaded back after a restart."""
+
+    _state = ()
+
+    def to_dict(self) -> dict:
+        state = {}
+        for name in self._state:
+            value = getattr(self, name)
+            state[name] = value.to_dict() if isinstance(value, RollingExtreme) else value
+        return {'type': type(self).__name__, 'state': state}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        accumulator = cls.__new__(cls)
+        for name, value in data['state'].items():
+            if isinstance(value, dict) and 'items' in value:
+                value = RollingExtreme.from_dict(value)
+            setattr(accumulator, name, value)
+        return accumulator
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    def update_many(self, *series):
+        """Feeds a whole history through update, e.g. to seed an accumulator the first time"""
+        for values in zip(*series):
+            self.update(*values)
+        return self
+
+
+def load_accumulator(path) -> Accumulator:
+    """Loads any accumulator saved with save"""
+    with open(path) as f:
+        data = json.load(f)
+    classes = {cls.__name__: cls for cls in Accumulator.__subclasses__()}
+    return classes[data['type']].from_dict(data)
+
+
+class VolatilityAccumulator(Accumulator):
+    """Volatility of daily returns with Welford's update, the same number as Portfolio.historic_vol"""
+
+    _state = ('period', 'last_price', 'count', 'mean', 'm2')
+
+    def __init__(self, period=252):
+        self.period = period
+        self.last_price = None
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, price) -> float:
+        if self.last_price is not None:
+            r = price / self.last_price - 1
+            self.count += 1
+            delta = r - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (r - self.mean)
+        self.last_price = price
+        return self.value
+
+    @property
+    def std(self) -> float:
+        return sqrt(self.m2 / (self.count - 1)) if self.count > 1 else nan
+
+    @property
+    def value(self) -> float:
+        return self.std * sqrt(self.period) * 100
+
+
+class SemiDeviationAccumulator(Accumulator):
+    """Standard deviation of the daily returns that fall below target. risk_metrics.semi_deviation uses the mean
+    return of the whole period as the cut off, which moves with every new day and can't be updated in O(1), so this
+    uses a fixed target (0 by default) instead."""
+
+    _state = ('target', 'last_price', 'count', 'mean', 'm2')
+
+    def __init__(self, target=0.0):
+        self.target = target
+        self.last_price = None
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, price) -> float:
+        if self.last_price is not None:
+            r = price / self.last_price - 1
+            if r < self.target:
+                self.count += 1
+                delta = r - self.mean
+                self.mean += delta / self.count
+                self.m2 += delta * (r - self.mean)
+        self.last_price = price
+        return self.value
+
+    @property
+    def value(self) -> float:
+        return sqrt(self.m2 / (self.count - 1)) if self.count > 1 else nan
+
+
+class BetaAccumulator(Accumulator):
+    """Beta against a benchmark, cov(stock, benchmark) / var(benchmark) kept up with Welford's co-moment update"""
+
+    _state = ('last_price', 'last_benchmark', 'count', 'mean', 'benchmark_mean', 'comoment', 'benchmark_m2')
+
+    def __init__(self):
+        self.last_price = None
+        self.last_benchmark = None
+        self.count = 0
+        self.mean = 0.0
+        self.benchmark_mean = 0.0
+        self.comoment = 0.0
+        self.benchmark_m2 = 0.0
+
+    def update(self, price, benchmark_price) -> float:
+        if self.last_price is not None:
+            r = price / self.last_price - 1
+            b = benchmark_price / self.last_benchmark - 1
+            self.count += 1
+            delta_b = b - self.benchmark_mean
+            self.benchmark_mean += delta_b / self.count
+            self.mean += (r - self.mean) / self.count
+            self.comoment += delta_b * (r - self.mean)
+            self.benchmark_m2 += delta_b * (b - self.benchmark_mean)
+        self.last_price = price
+        self.last_benchmark = benchmark_price
+        return self.value
+
+    @property
+    def value(self) -> float:
+        return self.comoment / self.benchmark_m2 if self.count > 1 and self.benchmark_m2 else nan
+
+
+class DrawdownAccumulator(Accumulator):
+    """Current drawdown and maximum drawdown. With a window it gives the same number as
+    risk_metrics.maximum_drawdown, the peak and the worst drawdown both only look back window days. Without one it
+    is the drawdown from the all time high."""
+
+    _state = ('peak', 'worst', 'drawdown')
+
+    def __init__(self, window=None):
+        self.peak = RollingExtreme(window, 'max')
+        self.worst = RollingExtreme(window, 'min')
+        self.drawdown = nan
+
+    def update(self, price) -> float:
+        self.drawdown = price / self.peak.push(price) - 1.0
+        self.worst.push(self.drawdown)
+        return self.value
+
+    @property
+    def value(self) -> float:
+        return self.worst.value
+
+
+class PainIndexAccumulator(Accumulator):
+    """Mean of the absolute drawdowns, the same number as risk_metrics.pain_index when given the same window"""
+
+    _state = ('peak', 'count', 'total')
+
+    def __init__(self, window=252):
+        self.peak = RollingExtreme(window, 'max')
+        self.count = 0
+        self.total = 0.0
+
+    def update(self, price) -> float:
+        peak = self.peak.push(price)
+        self.total += abs((price - peak) / peak)
+        self.count += 1
+        return self.value
+
+    @property
+    def value(self) -> float:
+        return self.total / self.count if self.count else nan
+
+
+if __name__ == '__main__':
+    pass
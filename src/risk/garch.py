@@ -0,0 +1,155 @@
+# -----------------------------------------------------------
+# GARCH(1,1) volatility forecasts and filtered historical simulation VaR / ES
+#
+# Stevens Institute of Technology, Hoboken, New Jersey
+# Stevens Student Managed Investment Fund
+# -----------------------------------------------------------
+
+import os
+import json
+import logging
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from scipy.signal import lfilter
+from scipy.optimize import minimize
+from concurrent.futures import ProcessPoolExecutor
+
+PARAMS_FILE = os.environ.get('SSMIF_GARCH_PARAMS', os.path.join(Path(__file__).parent.absolute(), 'garch_params.json'))
+
+# returns are fit in percent, the optimizer behaves a lot better than with numbers around 1e-4
+SCALE = 100.0
+
+
+def garch_variance(returns: np.ndarray, omega, alpha, beta) -> np.ndarray:
+    """Returns the GARCH(1,1) conditional variance for every day, sigma2[t] = omega + alpha * r[t-1]^2 +
+    beta * sigma2[t-1], starting from the sample variance. The recursion is a first order linear filter, so it is run
+    with scipy's lfilter instead of a python loop."""
+    sigma2_0 = returns.var()
+    shocks = omega + alpha * returns[:-1] ** 2
+    rest = lfilter([1.0], [1.0, -beta], shocks, zi=[beta * sigma2_0])[0]
+    return np.concatenate([[sigma2_0], rest])
+
+
+def _neg_loglik(params, returns):
+    omega, alpha, beta = params
+    if alpha + beta >= 1:
+        return 1e10  # outside the stationary region
+    sigma2 = garch_variance(returns, omega, alpha, beta)
+    if np.any(sigma2 <= 0):
+        return 1e10
+    return 0.5 * np.sum(np.log(sigma2) + returns ** 2 / sigma2)
+
+
+def fit_garch(returns, x0=None) -> dict:
+    """Fits a GARCH(1,1) to daily returns by maximum likelihood (normal innovations). x0 is a starting
+    (omega, alpha, beta), e.g. yesterday's fit, which makes the optimizer converge in a few steps.
+    For more information go to https://www.investopedia.com/terms/g/garch.asp"""
+    r = np.asarray(pd.Series(returns).dropna(), dtype=float) * SCALE
+    r = r - r.mean()
+    if x0 is None:
+        x0 = (r.var() * 0.05, 0.08, 0.9)
+    else:
+        x0 = (x0[0] * SCALE ** 2, x0[1], x0[2])
+    result = minimize(_neg_loglik, x0, args=(r,), method='L-BFGS-B',
+                      bounds=[(1e-8, None), (1e-6, 0.999), (1e-6, 0.999)])
+    omega, alpha, beta = result.x
+    sigma2 = garch_variance(r, omega, alpha, beta)
+    return {
+        'omega': omega / SCALE ** 2,
+        'alpha': alpha,
+        'beta': beta,
+        'loglik': -result.fun,
+        'converged': bool(result.success),
+        'iterations': int(result.nit),
+        'next_variance': (omega + alpha * r[-1] ** 2 + beta * sigma2[-1]) / SCALE ** 2,
+    }
+
+
+def standardized_residuals(returns, params: dict) -> np.ndarray:
+    """The returns divided by their GARCH volatility, what filtered historical simulation resamples from"""
+    r = np.asarray(pd.Series(returns).dropna(), dtype=float)
+    r = r - r.mean()
+    sigma2 = garch_variance(r * SCALE, params['omega'] * SCALE ** 2, params['alpha'], params['beta']) / SCALE ** 2
+    return r / np.sqrt(sigma2)
+
+
+def fhs_VaR(returns, params=None, confidence_level=0.05, horizon=1, n_sims=10000, seed=None) -> dict:
+    """Returns the filtered historical simulation VaR and expected shortfall (CVaR) as returns, losses negative.
+
+    For one day it is tomorrow's GARCH volatility times the quantile (and tail mean) of the standardized residuals.
+    For longer horizons n_sims paths are simulated by resampling the residuals and running them through the GARCH
+    recursion, so volatility clustering carries through the horizon."""
+    returns = pd.Series(returns).dropna()
+    params = fit_garch(returns) if params is None else params
+    z = standardized_residuals(returns, params)
+    mean = returns.mean()
+    if horizon == 1:
+        q = np.quantile(z, confidence_level)
+        sigma = np.sqrt(params['next_variance'])
+        return {'VaR': mean + sigma * q, 'CVaR': mean + sigma * z[z <= q].mean(), 'volatility': sigma}
+
+    rng = np.random.default_rng(seed)
+    sigma2 = np.full(n_sims, params['next_variance'])
+    total = np.zeros(n_sims)
+    for _ in range(horizon):
+        r = mean + np.sqrt(sigma2) * rng.choice(z, n_sims)
+        total += r
+        sigma2 = params['omega'] + params['alpha'] * (r - mean) ** 2 + params['beta'] * sigma2
+    q = np.quantile(total, confidence_level)
+    return {'VaR': q, 'CVaR': total[total <= q].mean(), 'volatility': np.sqrt(params['next_variance'])}
+
+
+def load_params(path=PARAMS_FILE) -> dict:
+    """The last fitted parameters for every ticker, used to warm start the next fit"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_params(params: dict, path=PARAMS_FILE):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(params, f)
+    os.replace(path + '.tmp', path)
+
+
+def _fit_one(args):
+    ticker, returns, x0, confidence_level = args
+    try:
+        params = fit_garch(returns, x0=x0)
+        return ticker, params, fhs_VaR(returns, params=params, confidence_level=confidence_level)
+    except Exception as e:
+        logging.warning('GARCH fit failed for {}: {}'.format(ticker, e))
+        return ticker, None, None
+
+
+def fit_universe(returns: pd.DataFrame, confidence_level=0.05, n_workers=None, params_file=PARAMS_FILE,
+                 warm_start=True) -> pd.DataFrame:
+    """Fits a GARCH(1,1) to every column of a DataFrame of daily returns (e.g. every stock we hold plus our NAV) on
+    a process pool and returns a DataFrame with the parameters and the one day FHS VaR and CVaR for each. The fitted
+    parameters are saved to params_file and, with warm_start, the saved ones are where tomorrow's fits start from."""
+    cached = load_params(params_file) if warm_start else {}
+    jobs = [(ticker, returns[ticker].dropna().to_numpy(), cached.get(ticker, {}).get('x'), confidence_level)
+            for ticker in returns.columns]
+    jobs = [(t, r, None if x0 is None else tuple(x0), c) for t, r, x0, c in jobs]
+
+    n_workers = os.cpu_count() if n_workers is None else n_workers
+    if n_workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(jobs))) as pool:
+            results = list(pool.map(_fit_one, jobs))
+    else:
+        results = [_fit_one(job) for job in jobs]
+
+    rows = {}
+    for ticker, params, var in results:
+        if params is None:
+            continue
+        cached[ticker] = {'x': [params['omega'], params['alpha'], params['beta']]}
+        rows[ticker] = {**params, **var}
+    save_params(cached, params_file)
+    return pd.DataFrame.from_dict(rows, orient='index')
+
+
+if __name__ == '__main__':
+    pass
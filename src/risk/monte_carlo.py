@@ -0,0 +1,96 @@
+# -----------------------------------------------------------
+# monte carlo VaR and CVaR of our portfolio, simulated in chunks across processes
+#
+# Stevens Institute of Technology, Hoboken, New Jersey
+# Stevens Student Managed Investment Fund
+# -----------------------------------------------------------
+
+import os
+import numpy as np
+import pandas as pd
+from math import ceil
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _simulate_chunk(seed, size, loading, drift, distribution, dof, tail_size):
+    """Simulates size portfolio returns and returns the tail_size worst ones along with the sum and sum of squares
+    of all of them. Only the tail is kept so memory doesn't grow with the number of scenarios."""
+    rng = np.random.default_rng(seed)
+    # correlated stock returns are L z, and the portfolio return is w . (L z) = z . (L^T w). The draws are made a
+    # block at a time so a chunk never holds more than about 2 million numbers for a big book
+    block = max(1, 2_000_000 // len(loading))
+    returns = np.concatenate([rng.standard_normal((min(block, size - i), len(loading))) @ loading
+                              for i in range(0, size, block)])
+    if distribution == 't':
+        # multivariate t: every stock in a scenario shares the same chi-square draw, scaled to keep the covariance
+        returns *= np.sqrt((dof - 2) / rng.chisquare(dof, size))
+    returns += drift
+    k = min(tail_size, size)
+    tail = np.partition(returns, k - 1)[:k]
+    return tail, returns.sum(), (returns ** 2).sum()
+
+
+def _run_chunk(args):
+    return _simulate_chunk(*args)
+
+
+def monte_carlo_VaR(weights, cov, mean=None, confidence_level=0.05, n_scenarios=1_000_000, chunk_size=100_000,
+                    distribution='normal', dof=5, horizon=1, seed=None, n_workers=None) -> dict:
+    """Returns the monte carlo value-at-risk and conditional value-at-risk of a portfolio as returns (losses are
+    negative, like risk_metrics.VaR), from n_scenarios simulated scenarios of correlated stock returns.
+
+    weights: Series of portfolio weights, cov: covariance matrix of daily returns, mean: mean daily returns (0 if
+    not given). distribution is 'normal' or 't' (multivariate t with dof degrees of freedom, for fatter tails).
+    horizon scales the daily mean and covariance to that many days.
+
+    Scenarios are drawn in chunks of chunk_size, each with its own seed spawned from seed, so the result is the same
+    whatever n_workers is. With n_workers > 1 the chunks are spread over a process pool."""
+    if distribution not in ('normal', 't'):
+        raise ValueError("distribution must be 'normal' or 't', got {}".format(distribution))
+    if distribution == 't' and dof <= 2:
+        raise ValueError('dof has to be more than 2 for the t distribution to have a covariance')
+
+    tickers = cov.index if isinstance(cov, pd.DataFrame) else None
+    w = (weights.reindex(tickers).fillna(0.0) if tickers is not None else pd.Series(weights)).to_numpy(dtype=float)
+    cov = np.asarray(cov, dtype=float) * horizon
+    mu = np.zeros(len(w)) if mean is None else np.asarray(mean, dtype=float) * horizon
+    # a tiny ridge keeps the cholesky factorization working for covariance matrices that are only semi-definite
+    chol = np.linalg.cholesky(cov + np.eye(len(w)) * 1e-12 * np.trace(cov))
+    loading = chol.T @ w
+    drift = float(w @ mu)
+
+    tail_size = max(1, ceil(n_scenarios * confidence_level))
+    sizes = [chunk_size] * (n_scenarios // chunk_size)
+    if n_scenarios % chunk_size:
+        sizes.append(n_scenarios % chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(s, size, loading, drift, distribution, dof, tail_size) for s, size in zip(seeds, sizes)]
+
+    tail = np.empty(0)
+    total = total_sq = 0.0
+    n_workers = os.cpu_count() if n_workers is None else n_workers
+    pool = ProcessPoolExecutor(max_workers=min(n_workers, len(jobs))) if n_workers > 1 and len(jobs) > 1 else None
+    try:
+        # the worst tail_size returns are merged in as each chunk finishes, so only one tail is held at a time
+        for chunk_tail, chunk_sum, chunk_sq in (pool.map(_run_chunk, jobs) if pool else map(_run_chunk, jobs)):
+            tail = np.concatenate([tail, chunk_tail])
+            tail = np.partition(tail, min(tail_size, len(tail)) - 1)[:tail_size]
+            total += chunk_sum
+            total_sq += chunk_sq
+    finally:
+        if pool:
+            pool.shutdown()
+
+    tail = np.sort(tail)
+    mean_return = total / n_scenarios
+    return {
+        'VaR': float(tail[-1]),
+        'CVaR': float(tail.mean()),
+        'mean': float(mean_return),
+        'std': float(np.sqrt(max(total_sq / n_scenarios - mean_return ** 2, 0.0))),
+        'scenarios': n_scenarios,
+    }
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,170 @@
+# -----------------------------------------------------------
+# breaks our portfolio volatility and VaR down into what each position contributes
+#
+# Stevens Institute of Technology, Hoboken, New Jersey
+# Stevens Student Managed Investment Fund
+# -----------------------------------------------------------
+
+import threading
+import numpy as np
+import pandas as pd
+from math import sqrt
+from collections import OrderedDict
+from scipy.stats import norm
+from src.metrics.ssmif_datareader import DataReader
+from src.metrics.nav_store import last_close
+
+
+class CovarianceModel:
+    """Covariance matrix of daily returns that can be updated one day at a time in O(n^2) for n stocks.
+
+    The model keeps (exponentially weighted, if halflife is given) sums of the returns and of their products, so a
+    new day of returns is folded in without going back over the history. With shrinkage='ledoit-wolf' it also keeps
+    the third and fourth order sums needed for the Ledoit-Wolf shrinkage intensity and shrinks the matrix towards a
+    scaled identity matrix.
+    For more information go to https://www.investopedia.com/terms/c/covariance-matrix.asp"""
+
+    def __init__(self, tickers, halflife=None, shrinkage=None):
+        if shrinkage not in (None, 'ledoit-wolf'):
+            raise ValueError("shrinkage must be None or 'ledoit-wolf', got {}".format(shrinkage))
+        self.tickers = list(tickers)
+        self.halflife = halflife
+        self.shrinkage = shrinkage
+        self.decay = 1.0 if halflife is None else 0.5 ** (1 / halflife)
+        n = len(self.tickers)
+        self.weight = 0.0  # total weight of the days seen, just the number of days without a halflife
+        self.s1 = np.zeros(n)
+        self.s2 = np.zeros((n, n))
+        self.s3 = np.zeros((n, n)) if shrinkage else None  # sum of x_i^2 * x_j
+        self.s4 = np.zeros((n, n)) if shrinkage else None  # sum of x_i^2 * x_j^2
+        self.last_date = None
+
+    def update(self, returns):
+        """Folds in one or more days of returns, a Series/array for one day or a DataFrame/2-D array for many. Days
+        with a missing return for any stock are skipped."""
+        if isinstance(returns, pd.DataFrame):
+            returns = returns[self.tickers].dropna()
+            if len(returns):
+                self.last_date = returns.index[-1]
+        elif isinstance(returns, pd.Series):
+            returns = returns[self.tickers]
+        x = np.atleast_2d(np.asarray(returns, dtype=float))
+        x = x[~np.isnan(x).any(axis=1)]
+        if not len(x):
+            return self
+
+        # the weight of each new day, oldest first, and how much the existing sums fade by
+        w = self.decay ** np.arange(len(x) - 1, -1, -1)
+        fade = self.decay ** len(x)
+        x2 = x ** 2
+        self.weight = fade * self.weight + w.sum()
+        self.s1 = fade * self.s1 + w @ x
+        self.s2 = fade * self.s2 + (x * w[:, None]).T @ x
+        if self.shrinkage:
+            self.s3 = fade * self.s3 + (x2 * w[:, None]).T @ x
+            self.s4 = fade * self.s4 + (x2 * w[:, None]).T @ x2
+        return self
+
+    @property
+    def mean(self) -> np.ndarray:
+        return self.s1 / self.weight
+
+    def sample_covariance(self, ddof=1) -> np.ndarray:
+        m = self.mean
+        cov = self.s2 / self.weight - np.outer(m, m)
+        if self.halflife is None and ddof:
+            cov *= self.weight / (self.weight - ddof)
+        return cov
+
+    def shrinkage_intensity(self) -> float:
+        """The Ledoit-Wolf shrinkage intensity, computed the same way as sklearn.covariance.ledoit_wolf"""
+        n, t, m = len(self.tickers), self.weight, self.mean
+        cov = self.sample_covariance(ddof=0)
+        q = np.diag(self.s2)
+        m2 = m ** 2
+        # sum over days of (x_i - m_i)^2 (x_j - m_j)^2 written out in terms of the raw sums
+        fourth = (self.s4 - 2 * self.s3 * m[None, :] - 2 * self.s3.T * m[:, None] + q[:, None] * m2[None, :]
+                  + m2[:, None] * q[None, :] + 4 * np.outer(m, m) * self.s2 - 3 * t * np.outer(m2, m2))
+        mu = np.trace(cov) / n
+        delta_ = np.sum(cov ** 2)
+        beta = (fourth.sum() / t - delta_) / (n * t)
+        delta = (delta_ - 2 * mu * np.trace(cov) + n * mu ** 2) / n
+        beta = min(beta, delta)
+        return 0.0 if beta == 0 else beta / delta
+
+    @property
+    def covariance(self) -> pd.DataFrame:
+        """The covariance matrix, shrunk if the model was made with shrinkage"""
+        if self.shrinkage:
+            cov = self.sample_covariance(ddof=0)
+            shrink = self.shrinkage_intensity()
+            cov = (1 - shrink) * cov + shrink * np.trace(cov) / len(self.tickers) * np.eye(len(self.tickers))
+        else:
+            cov = self.sample_covariance()
+        return pd.DataFrame(cov, index=self.tickers, columns=self.tickers)
+
+
+def risk_contributions(cov: pd.DataFrame, weights: pd.Series) -> pd.DataFrame:
+    """Returns how much each position adds to the portfolio's volatility (in the units of cov, daily if cov is of
+    daily returns).
+    marginal: how much the portfolio volatility changes per unit of extra weight in the stock
+    component: weight times marginal, these add up to the portfolio volatility
+    percent: component as a fraction of the portfolio volatility, these add up to 1"""
+    weights = weights.reindex(cov.index).fillna(0.0)
+    w = weights.to_numpy(dtype=float)
+    sigma_w = cov.to_numpy() @ w
+    vol = sqrt(w @ sigma_w)
+    marginal = sigma_w / vol
+    component = w * marginal
+    return pd.DataFrame({'weight': w, 'marginal': marginal, 'component': component, 'percent': component / vol},
+                        index=cov.index)
+
+
+def VaR_contributions(cov: pd.DataFrame, weights: pd.Series, confidence_level=0.05, horizon=252 / 12) -> pd.DataFrame:
+    """Returns how much each position adds to the portfolio's parametric (normal) value-at-risk, with the same sign
+    and monthly scaling as risk_metrics.VaR. The component VaRs add up to the portfolio VaR."""
+    z = norm.ppf(confidence_level) * sqrt(horizon)
+    contributions = risk_contributions(cov, weights)
+    return pd.DataFrame({'weight': contributions['weight'], 'marginal': z * contributions['marginal'],
+                         'component': z * contributions['component'], 'percent': contributions['percent']},
+                        index=cov.index)
+
+
+_models = OrderedDict()
+_models_lock = threading.Lock()
+
+
+def covariance_model(tickers, start, end, halflife=None, shrinkage=None, max_models=32) -> CovarianceModel:
+    """Returns a fitted CovarianceModel for the tickers' daily returns between start and end. Models are cached, and
+    when a cached model for the same tickers and start date ends earlier only the new days are pulled and folded in,
+    so the daily refresh doesn't refit from scratch. Models stop at the last completed close: a day still trading
+    would otherwise be folded in with its intraday price and, since updates only add later days, stay in for good."""
+    tickers = tuple(tickers)
+    start, end = pd.Timestamp(start), min(pd.Timestamp(end), last_close().normalize())
+    key = (tickers, start, halflife, shrinkage)
+    with _models_lock:
+        model = _models.get(key)
+        if model is not None and (model.last_date is None or model.last_date > end):
+            model = None  # a model can't be rolled back, fit a separate one
+        elif model is not None:
+            _models.move_to_end(key)
+
+    if model is not None:
+        if model.last_date < end:
+            prices = DataReader(list(tickers), start=model.last_date, end=end)['Adj Close']
+            new = prices.pct_change().dropna()
+            with _models_lock:
+                model.update(new[new.index > model.last_date])
+        return model
+
+    prices = DataReader(list(tickers), start=start, end=end)['Adj Close']
+    model = CovarianceModel(tickers, halflife=halflife, shrinkage=shrinkage).update(prices.pct_change().dropna())
+    with _models_lock:
+        _models[key] = model
+        while len(_models) > max_models:
+            _models.popitem(last=False)
+    return model
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,138 @@
+# -----------------------------------------------------------
+# replays past crises and factor shocks against our current book
+#
+# Stevens Institute of Technology, Hoboken, New Jersey
+# Stevens Student Managed Investment Fund
+# -----------------------------------------------------------
+
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from src.metrics.ssmif_datareader import DataReader
+
+# start and end of the market windows we replay, peak to trough of the S&P 500 unless noted
+HISTORICAL_SCENARIOS = {
+    '2008 Financial Crisis': ('2008-09-01', '2009-03-09'),
+    '2010 Flash Crash': ('2010-04-23', '2010-07-02'),
+    '2011 US Downgrade': ('2011-07-22', '2011-10-03'),
+    '2015 China Devaluation': ('2015-08-10', '2015-08-25'),
+    '2018 Volmageddon': ('2018-01-26', '2018-02-08'),
+    '2018 Q4 Selloff': ('2018-09-20', '2018-12-24'),
+    '2020 COVID Crash': ('2020-02-19', '2020-03-23'),
+    '2022 Rate Hikes': ('2022-01-03', '2022-10-12'),
+}
+
+
+class ScenarioSet:
+    """A set of scenarios to run against a book, stored as one (scenarios x days x tickers) array of daily returns.
+    Scenarios shorter than the longest one are padded with zero returns at the end."""
+
+    def __init__(self, names, tickers, returns: np.ndarray):
+        self.names = list(names)
+        self.tickers = list(tickers)
+        self.returns = returns
+        self.__key = None
+
+    def __add__(self, other):
+        if self.tickers != other.tickers:
+            other = other.reindex(self.tickers)
+        days = max(self.returns.shape[1], other.returns.shape[1])
+        pad = lambda r: np.pad(r, ((0, 0), (0, days - r.shape[1]), (0, 0)))
+        return ScenarioSet(self.names + other.names, self.tickers,
+                           np.concatenate([pad(self.returns), pad(other.returns)]))
+
+    def reindex(self, tickers):
+        """The same scenarios for a different list of tickers, any new ticker gets zero returns"""
+        position = {t: i for i, t in enumerate(self.tickers)}
+        returns = np.zeros(self.returns.shape[:2] + (len(tickers),))
+        for j, ticker in enumerate(tickers):
+            if ticker in position:
+                returns[:, :, j] = self.returns[:, :, position[ticker]]
+        return ScenarioSet(self.names, tickers, returns)
+
+    def key(self) -> str:
+        """A hash of the scenarios, worked out once since the returns array doesn't change"""
+        if self.__key is None:
+            self.__key = hashlib.sha1(str(self.names).encode() + str(self.tickers).encode()
+                                      + self.returns.tobytes()).hexdigest()
+        return self.__key
+
+
+def historical_scenarios(tickers, scenarios=HISTORICAL_SCENARIOS, proxy='^GSPC') -> ScenarioSet:
+    """Builds a ScenarioSet from the daily returns of the tickers over each named window. A stock that didn't trade
+    during a window (it listed later) is given the proxy's returns for the days it is missing."""
+    tickers = list(tickers)
+    paths = []
+    for start, end in scenarios.values():
+        prices = DataReader(list(dict.fromkeys(tickers + [proxy])), start=start, end=end)['Adj Close']
+        returns = prices.pct_change().iloc[1:]
+        returns[tickers] = returns[tickers].apply(lambda column: column.fillna(returns[proxy]))
+        paths.append(returns[tickers].fillna(0.0).to_numpy())
+    days = max([len(p) for p in paths] + [1])
+    returns = np.zeros((len(paths), days, len(tickers)))
+    for i, path in enumerate(paths):
+        returns[i, :len(path)] = path
+    return ScenarioSet(scenarios.keys(), tickers, returns)
+
+
+def factor_betas(tickers, factors, start, end) -> pd.DataFrame:
+    """Returns the (tickers x factors) exposures of each stock's daily returns to the factors' daily returns (e.g.
+    '^GSPC' and sector ETFs), fit for every stock at once with one least squares solve"""
+    tickers, factors = list(tickers), list(factors)
+    returns = DataReader(list(dict.fromkeys(tickers + factors)), start=start, end=end)['Adj Close']
+    returns = returns.pct_change().iloc[1:].dropna()
+    x = np.column_stack([np.ones(len(returns)), returns[factors].to_numpy()])
+    coef = np.linalg.lstsq(x, returns[tickers].to_numpy(), rcond=None)[0]
+    return pd.DataFrame(coef[1:].T, index=tickers, columns=factors)
+
+
+def factor_scenarios(shocks: dict, betas: pd.DataFrame) -> ScenarioSet:
+    """Builds one day scenarios from factor shocks, e.g. {'Market -20%': {'^GSPC': -0.2},
+    'Tech selloff': {'^GSPC': -0.05, 'XLK': -0.15}}. Each stock moves by its betas times the shocks."""
+    shock_matrix = pd.DataFrame.from_dict(shocks, orient='index').reindex(columns=betas.columns).fillna(0.0)
+    returns = shock_matrix.to_numpy() @ betas.to_numpy().T
+    return ScenarioSet(shock_matrix.index, betas.index, returns[:, None, :])
+
+
+_results = OrderedDict()
+_results_lock = threading.Lock()
+
+
+def stress_test(holdings: pd.Series, scenarios: ScenarioSet, max_cached=64) -> pd.DataFrame:
+    """Runs every scenario against a book of position values (a Series indexed by ticker, cash under 'CASH' is held
+    flat) and returns for each scenario the final P&L, the final return and the worst drawdown of the book's value
+    along the path. All scenarios are evaluated at once: the value paths are one product of the
+    (scenarios x days x tickers) growth array with the positions. Results are cached by the holdings and scenarios."""
+    holdings = holdings[holdings != 0]
+    key = (hashlib.sha1(pd.util.hash_pandas_object(holdings).values.tobytes()
+                        + str(list(holdings.index)).encode()).hexdigest(), scenarios.key())
+    with _results_lock:
+        if key in _results:
+            _results.move_to_end(key)
+            return _results[key].copy()
+
+    cash = holdings.get('CASH', 0.0)
+    positions = holdings.drop('CASH', errors='ignore').reindex(scenarios.tickers).fillna(0.0).to_numpy()
+    growth = np.cumprod(1 + scenarios.returns, axis=1)
+    values = growth @ positions + cash
+    start_value = positions.sum() + cash
+    values = np.concatenate([np.full((len(values), 1), start_value), values], axis=1)
+    drawdowns = values / np.maximum.accumulate(values, axis=1) - 1
+    results = pd.DataFrame({
+        'pnl': values[:, -1] - start_value,
+        'return': values[:, -1] / start_value - 1,
+        'worst_drawdown': drawdowns.min(axis=1),
+        'worst_value': values.min(axis=1),
+    }, index=pd.Index(scenarios.names, name='scenario'))
+
+    with _results_lock:
+        _results[key] = results
+        while len(_results) > max_cached:
+            _results.popitem(last=False)
+    return results
+
+
+if __name__ == '__main__':
+    pass
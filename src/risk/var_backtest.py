@@ -0,0 +1,149 @@
+# -----------------------------------------------------------
+# rolls VaR / CVaR estimators over our NAV history and checks them against what actually happened
+#
+# Stevens Institute of Technology, Hoboken, New Jersey
+# Stevens Student Managed Investment Fund
+# -----------------------------------------------------------
+
+import os
+import numpy as np
+import pandas as pd
+from scipy.stats import norm, chi2
+from scipy.special import xlogy
+from numpy.lib.stride_tricks import sliding_window_view
+from concurrent.futures import ProcessPoolExecutor
+
+
+def historical_estimator(windows: np.ndarray, confidence_level) -> tuple:
+    """One day VaR and CVaR for every row of windows (each row is a window of past daily returns), the empirical
+    quantile and the mean of the returns at or below it"""
+    var = np.quantile(windows, confidence_level, axis=1)
+    tail = windows <= var[:, None]
+    cvar = np.where(tail, windows, 0.0).sum(axis=1) / tail.sum(axis=1)
+    return var, cvar
+
+
+def parametric_estimator(windows: np.ndarray, confidence_level) -> tuple:
+    """One day VaR and CVaR for every row of windows assuming normally distributed returns"""
+    mean, std = windows.mean(axis=1), windows.std(axis=1, ddof=1)
+    z = norm.ppf(confidence_level)
+    return mean + z * std, mean - std * norm.pdf(z) / confidence_level
+
+
+def ewma_estimator(windows: np.ndarray, confidence_level, decay=0.94) -> tuple:
+    """One day VaR and CVaR for every row of windows with RiskMetrics' exponentially weighted volatility"""
+    weights = decay ** np.arange(windows.shape[1] - 1, -1, -1)
+    weights /= weights.sum()
+    std = np.sqrt((windows ** 2) @ weights)
+    z = norm.ppf(confidence_level)
+    return z * std, -std * norm.pdf(z) / confidence_level
+
+
+ESTIMATORS = {
+    'historical': historical_estimator,
+    'parametric': parametric_estimator,
+    'ewma': ewma_estimator,
+}
+
+
+def _forecast_batch(args):
+    """VaR and CVaR forecasts for the windows ending at positions lo..hi-1 of returns, for every estimator and
+    confidence level"""
+    returns, window, lo, hi, estimators, confidence_levels = args
+    windows = sliding_window_view(returns, window)[lo:hi]
+    return {(name, level): ESTIMATORS[name](windows, level) for name in estimators for level in confidence_levels}
+
+
+def kupiec_test(exceedances: np.ndarray, confidence_level) -> tuple:
+    """Kupiec's proportion of failures test: the likelihood ratio and p-value for the number of VaR breaches being
+    what the confidence level says it should be"""
+    n, x = len(exceedances), int(exceedances.sum())
+    rate = x / n
+    lr = -2 * (xlogy(n - x, 1 - confidence_level) + xlogy(x, confidence_level)
+               - xlogy(n - x, 1 - rate) - xlogy(x, rate))
+    return lr, chi2.sf(lr, 1)
+
+
+def christoffersen_test(exceedances: np.ndarray) -> tuple:
+    """Christoffersen's independence test: the likelihood ratio and p-value for breaches not clustering together,
+    i.e. a breach today not making one tomorrow more likely"""
+    previous, current = exceedances[:-1], exceedances[1:]
+    n00 = np.sum(~previous & ~current)
+    n01 = np.sum(~previous & current)
+    n10 = np.sum(previous & ~current)
+    n11 = np.sum(previous & current)
+    pi01 = n01 / max(n00 + n01, 1)
+    pi11 = n11 / max(n10 + n11, 1)
+    pi = (n01 + n11) / max(n00 + n01 + n10 + n11, 1)
+    lr = -2 * (xlogy(n00 + n10, 1 - pi) + xlogy(n01 + n11, pi)
+               - xlogy(n00, 1 - pi01) - xlogy(n01, pi01) - xlogy(n10, 1 - pi11) - xlogy(n11, pi11))
+    return lr, chi2.sf(lr, 1)
+
+
+def rolling_forecasts(price_data: pd.Series, window=252, estimators=('historical', 'parametric', 'ewma'),
+                      confidence_levels=(0.01, 0.05), n_workers=None, batch_size=500) -> pd.DataFrame:
+    """Returns the one day VaR and CVaR forecast of every estimator at every confidence level for each day, each
+    made from the window days of returns before it, next to the return that actually happened. The windows are
+    split into batches of batch_size that are worked on by a process pool when n_workers > 1."""
+    returns = price_data.pct_change().dropna()
+    values = returns.to_numpy(dtype=float)
+    n_forecasts = len(values) - window
+    if n_forecasts <= 0:
+        raise ValueError('need more than window={} days of returns, got {}'.format(window, len(values)))
+
+    # windows ending the day before each forecast day, so the row for day t only uses returns up to t-1
+    jobs = [(values[:-1], window, lo, min(lo + batch_size, n_forecasts), tuple(estimators), tuple(confidence_levels))
+            for lo in range(0, n_forecasts, batch_size)]
+    n_workers = os.cpu_count() if n_workers is None else n_workers
+    if n_workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(jobs))) as pool:
+            batches = list(pool.map(_forecast_batch, jobs))
+    else:
+        batches = [_forecast_batch(job) for job in jobs]
+
+    forecasts = {'return': values[window:]}
+    for name in estimators:
+        for level in confidence_levels:
+            forecasts[(name, level, 'VaR')] = np.concatenate([b[(name, level)][0] for b in batches])
+            forecasts[(name, level, 'CVaR')] = np.concatenate([b[(name, level)][1] for b in batches])
+    return pd.DataFrame(forecasts, index=returns.index[window:])
+
+
+def backtest_VaR(price_data: pd.Series, window=252, estimators=('historical', 'parametric', 'ewma'),
+                 confidence_levels=(0.01, 0.05), n_workers=None, batch_size=500) -> pd.DataFrame:
+    """Backtests one day VaR / CVaR estimators on a price (or NAV) series. Returns a row for every estimator and
+    confidence level with the number of breaches against the number expected, the Kupiec, Christoffersen and
+    conditional coverage tests, and the average return on breach days next to the average CVaR forecast for them
+    (the two should be close if CVaR is right).
+    For more information go to https://www.investopedia.com/terms/b/backtesting.asp"""
+    forecasts = rolling_forecasts(price_data, window=window, estimators=estimators,
+                                  confidence_levels=confidence_levels, n_workers=n_workers, batch_size=batch_size)
+    realized = forecasts['return'].to_numpy()
+    rows = {}
+    for name in estimators:
+        for level in confidence_levels:
+            var = forecasts[(name, level, 'VaR')].to_numpy()
+            cvar = forecasts[(name, level, 'CVaR')].to_numpy()
+            breaches = realized < var
+            kupiec_lr, kupiec_p = kupiec_test(breaches, level)
+            ind_lr, ind_p = christoffersen_test(breaches)
+            rows[(name, level)] = {
+                'days': len(breaches),
+                'breaches': int(breaches.sum()),
+                'expected': level * len(breaches),
+                'breach_rate': breaches.mean(),
+                'kupiec_lr': kupiec_lr,
+                'kupiec_p': kupiec_p,
+                'independence_lr': ind_lr,
+                'independence_p': ind_p,
+                'conditional_coverage_p': chi2.sf(kupiec_lr + ind_lr, 2),
+                'mean_breach_return': realized[breaches].mean() if breaches.any() else np.nan,
+                'mean_breach_CVaR': cvar[breaches].mean() if breaches.any() else np.nan,
+            }
+    results = pd.DataFrame.from_dict(rows, orient='index')
+    results.index.names = ['estimator', 'confidence_level']
+    return results
+
+
+if __name__ == '__main__':
+    pass